@@ -1,22 +1,125 @@
+import asyncio
+import json
 import re
+from dataclasses import asdict
+from functools import cache
+from typing import AsyncIterator
 
-import openai
 import snick
 from loguru import logger
 
+from bot.cache import GuessCache, roster_fingerprint
+from bot.classifier import IntentClassifier
+from bot.completions import complete, stream
 from bot.config import settings
-from bot.exceptions import BadCommandInterpretation, BadUserInterpretation
-from bot.types import CommandGuess, UserGuess, ActionGuess
-from bot.constants import Command
+from bot.conversation import Conversation
+from bot.members import MemberIndex
+from bot.output import ChatBuffer, current_buffer
+from bot.replies import miss_reply, offline_reply
+from bot.exceptions import AIError, AITransientError, BadCommandInterpretation
+from bot.types import ActionGuess, IntentGuess
+from bot.constants import Command, GameStatus, Poison, ReplyKind
+
+
+@cache
+def summary_prompt() -> str:
+    return snick.dedent(
+        """
+        You summarize chat transcripts. You will be given an existing summary, which may be empty,
+        followed by lines of conversation that happened after it. Reply with a new summary of the
+        whole conversation in no more than three sentences. Keep any names, commands, and game
+        details that might matter later.
+        """
+    )
+
+
+summary_tasks: set[asyncio.Task] = set()
+
+_guess_cache: GuessCache | None = None
+_classifier: IntentClassifier | None = None
+
 
+def get_guess_cache() -> GuessCache:
+    global _guess_cache
+    if _guess_cache is None:
+        _guess_cache = GuessCache(
+            settings.DATA_DIR / "guess_cache.sqlite3",
+            max_entries=settings.AI_CACHE_MAX_ENTRIES,
+            ttl=settings.AI_CACHE_TTL,
+        )
+    return _guess_cache
+
+
+def get_classifier() -> IntentClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = IntentClassifier(
+            settings.DATA_DIR / "intents.sqlite3",
+            max_examples=settings.CLASSIFIER_MAX_EXAMPLES,
+            min_examples=settings.CLASSIFIER_MIN_EXAMPLES,
+            retrain_every=settings.CLASSIFIER_RETRAIN_EVERY,
+        )
+    return _classifier
+
+
+def close():
+    global _guess_cache, _classifier
+    if _guess_cache is not None:
+        _guess_cache.close()
+    if _classifier is not None:
+        _classifier.close()
+    _guess_cache = None
+    _classifier = None
+
+
+def __reload__(state: dict):
+    """
+    Carry live state over from the previous version of this module after a hot reload.
+    """
+    global _guess_cache, _classifier
+    _guess_cache = state["_guess_cache"]
+    _classifier = state["_classifier"]
+    summary_tasks.update(state["summary_tasks"])
+    intent_conversation().adopt(state["intent_conversation"]())
+    chat_conversation().adopt(state["chat_conversation"]())
+
+
+async def summarize(conversation: Conversation, channel_id: int):
+    evicted = conversation.pop_evicted(channel_id)
+    if len(evicted) == 0:
+        return
+
+    previous = conversation.summaries.get(channel_id, "")
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+    logger.debug(f"Summarizing {len(evicted)} old messages for channel {channel_id}")
+    try:
+        response = await complete(
+            [
+                dict(role="system", content=summary_prompt()),
+                dict(role="user", content=f"Summary: {previous}\n\n{transcript}"),
+            ],
+            stage="summarize",
+            temperature=0,
+            max_tokens=settings.AI_SUMMARY_MAX_TOKENS,
+        )
+    except AIError as err:
+        logger.debug(f"Couldn't summarize conversation for channel {channel_id}: {err}")
+        return
+    conversation.set_summary(channel_id, response.choices[0].message.content)
 
-openai.api_key = settings.OPENAI_API_KEY
 
+def schedule_summary(conversation: Conversation, channel_id: int):
+    if not conversation.summarize or channel_id not in conversation.evicted:
+        return
+    task = asyncio.create_task(summarize(conversation, channel_id))
+    summary_tasks.add(task)
+    task.add_done_callback(summary_tasks.discard)
 
-command_ai_messages = [
-    dict(
-        role="system",
-        content=snick.dedent(
+
+@cache
+def intent_conversation() -> Conversation:
+    return Conversation(
+        system_prompt=snick.dedent(
             """
             You are a discord bot that runs a game among members that have joined in a
             single channel dedicated to the game.
@@ -40,111 +143,275 @@ command_ai_messages = [
               - CHECK_PROBER: The player wants to see if the challenging player is still in the game
               - CHECK_VICTIM: The player wants to see if the challenged player is still in the game
               - PICK_PROBER: The player is choosing the next player to be a challenger
-              - DOUBLE: The user is passing their challenge on to another user
 
             Users may send messages that don't match the commands exactly. Your job is to
-            figure out what command they actually want.
-
-            You will reply to each message with one sentence. The sentence should be prefixed by the
-            guessed command followed by two dashes and then an explanation of why the command was chosen.
-
-            For example, if a user typed in "I think dusky should go next", you should respond like:
-            "CHOOSE_VICTIM -- I chose CHOOSE_VICTIM because the player is saying that they want Dusky to
-            be the next player to take a turn."
+            figure out what command they actually want and record it with the choose_intent function.
 
-            The commands, CHOOSE_VICTIM, ENLIST, CHOOSE_VICTIM, CHOOSE_POISON, and CHOOSE_ORDEAL, involve
-            another user that will be mentioned in the user's message. For these messages, you should
-            include the username after the command and separated by a colon. For example, if the user
-            says, "I pick johnny", then your response should look like:
-            "CHOOSE_VICTIM:johnny -- I chose this because the user is challenging johnny next.
+            The commands ENLIST, CHOOSE_VICTIM, and PICK_PROBER involve another member of the
+            server. You will be given a roster of members as lines of an id and a name. Set target_id
+            to the id of the member the player means, even if they misspelled the name. A mention
+            like <@12341234123412> refers to the member with that id. If nobody on the roster matches,
+            leave target_id empty and set target_name to the name as the player wrote it.
 
-            It's also possible that the username mentioned is a formatted text string like,
-            <@12341234123412>. In this case, the number should be used as the user guess.
+            For CHOOSE_POISON, set choice to TRUTH, DARE, or WYR. For CHOOSE_ORDEAL, set choice to
+            the text of the challenge.
 
-            For any messages that do not match a command, the resulting command should be
-            "MISS" followed by an explanation.
-
-            The output of your response will be parsed by an algorithm that will split on
-            the dashes, so it is very important that your responses are precise.
+            For any messages that do not match a command, the command should be MISS. For CHAT and
+            MISS, also set reply to what you would say back to the player as a playful but ornery
+            anthropomorphic dog in one to three sentences. For a MISS, make fun of the player for
+            not knowing how to play truth or dare.
             """
         ),
-    ),
-]
-
+        token_budget=settings.AI_HISTORY_TOKEN_BUDGET,
+        max_turns=settings.AI_HISTORY_MAX_TURNS,
+        max_channels=settings.AI_HISTORY_MAX_CHANNELS,
+        summarize=settings.AI_SUMMARIZE_HISTORY,
+    )
 
-def guess_command(text) -> CommandGuess:
-    logger.debug(f"Command AI processing input: {text}")
-    command_ai_messages.append(dict(role="user", content=text))
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo-16k",
-        messages=command_ai_messages,
-        temperature=1,
-        max_tokens=100,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0
+intent_function = dict(
+    name="choose_intent",
+    description="Record what the player wants the bot to do",
+    parameters=dict(
+        type="object",
+        properties=dict(
+            command=dict(type="string", enum=[c.value for c in Command]),
+            target_id=dict(type="string", description="Roster id of the member the command is about"),
+            target_name=dict(type="string", description="The name the player used if it isn't on the roster"),
+            choice=dict(type="string", description="The poison or the ordeal text that was chosen"),
+            reply=dict(type="string", description="What to say back to the player for CHAT or MISS"),
+            explanation=dict(type="string", description="Why this command was chosen"),
+        ),
+        required=["command", "explanation"],
+    ),
+)
+
+intent_options = dict(
+    functions=[intent_function],
+    function_call=dict(name=intent_function["name"]),
+    temperature=1,
+    max_tokens=200,
+    top_p=1,
+    frequency_penalty=0,
+    presence_penalty=0
+)
+
+COMMAND_FIELD = re.compile(r'"command"\s*:\s*"(?P<command>[^"]*)"')
+REPLY_FIELD = re.compile(r'"reply"\s*:\s*"')
+
+
+def pick_roster(text: str, member_index: MemberIndex, player_ids: list[int]) -> list[int]:
+    """
+    Choose which members to show the AI so that the prompt stays small in large servers.
+
+    Small servers are sent whole. Otherwise mentioned members, current players, and the
+    closest name matches for each word of the message are sent, up to ``AI_ROSTER_LIMIT``.
+    """
+    limit = settings.AI_ROSTER_LIMIT
+    if len(member_index) <= limit:
+        return list(member_index.members)
+
+    roster: dict[int, None] = {}
+    mentioned = [int(member_id) for member_id in re.findall(r"<@(\d+)>", text)]
+    for member_id in [*mentioned, *player_ids]:
+        if member_id in member_index:
+            roster[member_id] = None
+    for word in re.findall(r"\w{3,}", text):
+        for name_match in member_index.names.search(word, limit=3):
+            if name_match.score >= settings.NAME_MATCH_THRESHOLD:
+                roster[name_match.member_id] = None
+    return list(roster)[:limit]
+
+
+def partial_command(arguments: str) -> str | None:
+    command_field = COMMAND_FIELD.search(arguments)
+    if command_field is None:
+        return None
+    return command_field.group("command").strip().upper().replace(" ", "_")
+
+
+def partial_reply(arguments: str) -> str | None:
+    """
+    Decode as much of the reply as has arrived so far in the JSON arguments of an intent call.
+    """
+    reply_field = REPLY_FIELD.search(arguments)
+    if reply_field is None:
+        return None
+    raw = arguments[reply_field.end():]
+    end = 0
+    while end < len(raw) and raw[end] != '"':
+        # Stop short of an escape sequence that hasn't fully arrived yet
+        size = 6 if raw[end:end + 2] == "\\u" else 2 if raw[end] == "\\" else 1
+        if end + size > len(raw):
+            break
+        end += size
+    try:
+        return json.loads(f'"{raw[:end]}"', strict=False)
+    except json.JSONDecodeError:
+        return None
+
+
+def parse_intent_call(arguments: str) -> IntentGuess:
+    try:
+        arguments = json.loads(arguments)
+    except json.JSONDecodeError as err:
+        raise BadCommandInterpretation(f"AI intent arguments were not valid JSON: {err}")
+    BadCommandInterpretation.require_condition(
+        isinstance(arguments, dict) and isinstance(arguments.get("command"), str),
+        "AI intent arguments had no command",
     )
-    message = response.choices[0].message
-    logger.debug(f"AI responded with {message=}")
-    command_ai_messages.append(message)
-    pattern = r"(?P<command>\w+)(?::(?P<target>\s*.+))?\s*--\s*(?P<explanation>.*)"
-    regex_match: re.Match = BadCommandInterpretation.enforce_defined(
-        re.search(pattern, message.content),
-        "AI Parsed command had an invalid pattern",
+
+    def _text(key: str) -> str | None:
+        value = arguments.get(key)
+        if not isinstance(value, str) or value.strip() == "":
+            return None
+        return value.strip()
+
+    target_id = _text("target_id")
+    return IntentGuess(
+        command=arguments["command"].strip().upper().replace(" ", "_"),
+        explanation=_text("explanation") or "",
+        target_id=int(target_id) if target_id is not None and target_id.isdigit() else None,
+        target_name=_text("target_name"),
+        choice=_text("choice"),
+        reply=_text("reply"),
     )
-    command_match = regex_match.group("command")
-    explanation_match = regex_match.group("explanation")
-    target_match = regex_match.group("target")
-
-    logger.debug(f"Parsed guess as: {command_match=}, {explanation_match=}, {target_match=}")
-    guess = CommandGuess(
-        command=command_match,
-        explanation=explanation_match,
-        target=target_match,
+
+
+async def stream_intent(messages: list[dict], buffer: ChatBuffer, prefix: str) -> tuple[str, bool]:
+    """
+    Stream the intent call and show a CHAT or MISS reply in ``buffer`` while it is written.
+
+    Nothing is posted until the arguments name one of those commands and the reply has begun.
+    Returns the arguments and whether the reply was shown. If the stream breaks after that, the
+    reply so far stands in for the whole of it.
+    """
+    chunks = stream(messages, stage="guess_intent", **intent_options)
+    arguments = ""
+    (command, reply) = (None, "")
+
+    async def _reply_deltas():
+        nonlocal arguments, command, reply
+        try:
+            async for delta in chunks:
+                arguments += delta
+                command = partial_command(arguments)
+                if command not in (Command.CHAT.value, Command.MISS.value):
+                    continue
+                so_far = partial_reply(arguments)
+                if so_far is not None and len(so_far) > len(reply):
+                    yield so_far[len(reply):]
+                    reply = so_far
+        except AIError as err:
+            if reply == "":
+                raise
+            logger.debug(f"Intent stream broke after the reply began: {err}")
+            arguments = json.dumps(dict(command=command, reply=reply, explanation="The stream broke"))
+
+    deltas = _reply_deltas()
+    first = await anext(deltas, None)
+    if first is None:
+        return (arguments, False)
+
+    async def _all_deltas():
+        yield first
+        async for delta in deltas:
+            yield delta
+
+    await buffer.stream(prefix, _all_deltas(), edit_interval=settings.CHAT_STREAM_EDIT_INTERVAL)
+    return (arguments, True)
+
+
+async def guess_intent(
+    text,
+    member_index: MemberIndex,
+    channel_id: int,
+    status: GameStatus,
+    player_ids: list[int],
+    buffer: ChatBuffer | None = None,
+    prefix: str = "",
+) -> tuple[IntentGuess, bool]:
+    """
+    Ask the AI which command a message means. Returns the guess and whether its reply was shown.
+
+    Given a ``buffer``, the call is streamed so that a CHAT or MISS reply appears as it is written.
+    """
+    logger.debug(f"Intent AI processing input: {text}")
+    roster = pick_roster(text, member_index, player_ids)
+    roster_text = "\n".join(f"{member_id}: {member_index.get(member_id).display_name}" for member_id in roster)
+    roster_key = f"{status.value}:{roster_fingerprint(roster_text.splitlines())}"
+    cached = get_guess_cache().get("intent", text, roster_key)
+    if cached is not None:
+        return (IntentGuess(**cached), False)
+
+    intent_conversation().add(channel_id, "user", text)
+    messages = intent_conversation().messages(
+        channel_id,
+        f"The game is currently {status.value}.",
+        f"Roster:\n{roster_text}",
     )
+    shown = False
+    if buffer is not None:
+        try:
+            (arguments, shown) = await stream_intent(messages, buffer, prefix)
+        except AITransientError as err:
+            # Nothing was shown yet, so the call can still be retried without streaming
+            logger.debug(f"Intent stream failed before the reply began: {err}")
+            buffer = None
+    if buffer is None:
+        response = await complete(messages, stage="guess_intent", **intent_options)
+        message = response.choices[0].message
+        logger.debug(f"AI responded with {message=}")
+        function_call = BadCommandInterpretation.enforce_defined(
+            message.get("function_call"),
+            "AI did not call the intent function",
+        )
+        arguments = function_call.arguments
 
-    logger.debug(f"Command AI guesses: {guess}")
+    guess = parse_intent_call(arguments)
+    intent_conversation().add(channel_id, "assistant", arguments)
+    schedule_summary(intent_conversation(), channel_id)
 
-    return guess
+    logger.debug(f"Intent AI guesses: {guess}")
+    # Replies are meant for one exchange, so only the interpretation is cached
+    get_guess_cache().put("intent", text, roster_key, asdict(guess) | dict(reply=None))
 
+    return (guess, shown)
 
-chat_ai_messages = [
-    dict(
-        role="system",
-        content=snick.dedent(
-            """
-            You are an anthropomorphic dog. You are playful but ornery. You like to joke with
-            people and your sense of humor is somewhat blue. You like to joke around about
-            people taking dares or sharing uncomfortable truths.
 
-            You should not greet the user because you are already familiar friends.
+@cache
+def chat_prompt() -> str:
+    return snick.dedent(
+        """
+        You are an anthropomorphic dog. You are playful but ornery. You like to joke with
+        people and your sense of humor is somewhat blue. You like to joke around about
+        people taking dares or sharing uncomfortable truths.
 
-            You should limit your response to one to three sentences.
-            """
-        ),
-    ),
-]
+        You should not greet the user because you are already familiar friends.
+
+        You should limit your response to one to three sentences.
+        """
+    )
 
 
-def get_chat(text, was_miss=False):
+@cache
+def chat_conversation() -> Conversation:
+    return Conversation(
+        system_prompt=chat_prompt(),
+        token_budget=settings.AI_HISTORY_TOKEN_BUDGET,
+        max_turns=settings.AI_HISTORY_MAX_TURNS,
+        max_channels=settings.AI_HISTORY_MAX_CHANNELS,
+        summarize=settings.AI_SUMMARIZE_HISTORY,
+    )
+
+
+async def get_chat(text, channel_id: int):
     logger.debug(f"AI processing input: {text}")
-    messages = chat_ai_messages
-    if was_miss:
-        messages.append(
-            dict(
-                role="system",
-                content=snick.dedent(
-                    """
-                    You should make fun of the user for trying to use an unknown command and
-                    not knowing how to play truth or dare.
-                    """
-                ),
-            ),
-        )
+    chat_conversation().add(channel_id, "user", text)
+    messages = chat_conversation().messages(channel_id)
 
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo-16k",
-        messages=messages,
+    response = await complete(
+        messages,
+        stage="get_chat",
         temperature=1.5,
         max_tokens=100,
         top_p=1,
@@ -153,120 +420,182 @@ def get_chat(text, was_miss=False):
     )
     message = response.choices[0].message.content
     logger.debug(f"AI sasses: '{message}'")
+    chat_conversation().add(channel_id, "assistant", message)
+    schedule_summary(chat_conversation(), channel_id)
     return message
 
 
-user_ai_messages = [
-    dict(
-        role="system",
-        content=snick.dedent(
-            """
-            You are a discord bot that attempts to match a provided name with a username
-            from a list of users that are in the same channel. You will be provided a
-            name to match and a list of usernames. The name may not match a username
-            exactly, so you need to pick the one that is closest. If none of the
-            usernames are similar to the provided name, you should not select one.
-
-            The input will be given as the provided name followed by a colon and then
-            a comma-separated list of potential matches.
-
-            You will reply to each message with one sentence. The sentence should have a
-            single word which is the username you selected from the list followed by two
-            dashes and then an explanation of why the username was chosen.
-            """
-        ),
-    ),
-]
-
+async def stream_chat(text, channel_id: int) -> AsyncIterator[str]:
+    """
+    Stream a chat reply, falling back to a canned one if the AI fails before saying anything.
+    """
+    logger.debug(f"AI streaming input: {text}")
+    chat_conversation().add(channel_id, "user", text)
+    messages = chat_conversation().messages(channel_id)
+
+    message = ""
+    try:
+        async for delta in stream(
+            messages,
+            stage="stream_chat",
+            temperature=1.5,
+            max_tokens=100,
+            top_p=1,
+            frequency_penalty=0,
+            presence_penalty=0
+        ):
+            message += delta
+            yield delta
+    except AIError as err:
+        logger.debug(f"Chat stream failed: {err}")
+        if message == "":
+            message = offline_reply()
+            yield message
 
-def guess_user(text, user_list: list[str]) -> UserGuess:
-    logger.debug(f"User AI processing input: {text=}, {user_list=}")
-    user_list_text = ", ".join(user_list)
-    user_ai_messages.append(
-        dict(
-            role="user",
-            content=f"{text}: {user_list_text}",
-        )
-    )
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo-16k",
-        messages=user_ai_messages,
-        temperature=1,
-        max_tokens=30,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0
+    logger.debug(f"AI sasses: '{message}'")
+    chat_conversation().add(channel_id, "assistant", message)
+    schedule_summary(chat_conversation(), channel_id)
+
+
+@cache
+def ordeal_prompt() -> str:
+    return snick.dedent(
+        """
+        You write ordeals for a game of truth or dare played in a discord server. When asked for
+        ordeals of a kind, reply with only a JSON array of that many distinct strings and nothing
+        else. A TRUTH is a probing question, a DARE is something the player must do and can prove
+        in the chat, and a WYR is a "would you rather" question with two options. Keep them fun,
+        a little spicy, and safe for a public server.
+        """
     )
-    message = response.choices[0].message
-    logger.debug(f"AI responded with {message=}")
 
-    pattern = r"(?P<name>.+)\s*--+\s*(?P<explanation>.*)"
-    regex_match: re.Match = BadUserInterpretation.enforce_defined(
-        re.search(pattern, message.content),
-        "AI Parsed user had an invalid pattern",
-    )
-    name_match = regex_match.group("name")
-    explanation_match = regex_match.group("explanation")
 
-    logger.debug(f"Parsed guess as: {name_match=}, {explanation_match=}")
-    guess = UserGuess(
-        name=name_match.strip(),
-        explanation=explanation_match,
+def parse_text_list(content: str) -> list[str]:
+    """
+    Read a list of texts from a reply that should be a JSON array, or else one text per line.
+    """
+    try:
+        texts = json.loads(content)
+    except json.JSONDecodeError:
+        texts = [re.sub(r"^\s*(?:[-*]|\d+[.)])\s*", "", line) for line in content.splitlines()]
+    if not isinstance(texts, list):
+        return []
+    return [text.strip() for text in texts if isinstance(text, str) and text.strip() != ""]
+
+
+async def generate_ordeals(kind: str, count: int) -> list[str]:
+    response = await complete(
+        [
+            dict(role="system", content=ordeal_prompt()),
+            dict(role="user", content=f"Write {count} {kind} ordeals."),
+        ],
+        stage="generate_ordeals",
+        temperature=1.2,
+        max_tokens=60 * count,
     )
+    return parse_text_list(response.choices[0].message.content or "")
 
-    logger.debug(f"User AI guesses: {guess}")
 
-    return guess
+@cache
+def reply_prompts() -> dict[ReplyKind, str]:
+    return {
+        ReplyKind.MISS: snick.dedent(
+            """
+            Make fun of a user for trying to use an unknown command and not knowing how to play
+            truth or dare. Tell them to say `status` to see what they can do.
+            """
+        ),
+        ReplyKind.THROTTLED: snick.dedent(
+            """
+            Tell a user to slow down because they are sending messages faster than you can think.
+            Mention that plain commands like `join` or `status` still work.
+            """
+        ),
+    }
 
 
-def guess_action(action_guess: ActionGuess, text: str, player_id_map: dict[str, int]):
-    command_guess: CommandGuess = guess_command(text)
-    command_guess.command = command_guess.command.replace(" ", "_")
-    if command_guess.command is Command.CHAT:
-        chat_message = get_chat(text)
-        logger.info(f"<@{action_guess.player_id}>, {chat_message}")
-    elif command_guess.command is Command.MISS:
-        chat_message = get_chat(message.content, was_miss=True)
-        logger.info(f"<@{action_guess.player_id}>, {chat_message}")
-    else:
-        try:
-            action_guess.command = Command(command_guess.command)
-        except Exception as err:
-            logger.debug(f"Invalid command guessed by AI: {command_guess.command}: {err}")
-            logger.info(
-                snick.unwrap(
-                    f"""
-                    I'm an idiot! I got confused and made up my own command:
-                    {command_guess.command}.
-                    Please try again, and I'll try to be smarter!
-                    """
-                )
+async def generate_replies(kind: str, count: int) -> list[str]:
+    response = await complete(
+        [
+            dict(role="system", content=chat_prompt()),
+            dict(
+                role="user",
+                content=(
+                    f"Write {count} different one-sentence replies for this situation, as a JSON array "
+                    f"of strings and nothing else. Don't address anyone by name.\n\n{reply_prompts()[ReplyKind(kind)]}"
+                ),
+            ),
+        ],
+        stage="generate_replies",
+        temperature=1.2,
+        max_tokens=40 * count,
+    )
+    return parse_text_list(response.choices[0].message.content or "")
+
+
+async def guess_action(
+    action_guess: ActionGuess,
+    text: str,
+    member_index: MemberIndex,
+    channel_id: int,
+    status: GameStatus,
+    player_ids: list[int],
+):
+    buffer = current_buffer.get() if settings.CHAT_STREAMING else None
+    prefix = f"<@{action_guess.player_id}>, "
+    (intent_guess, shown) = await guess_intent(text, member_index, channel_id, status, player_ids, buffer, prefix)
+    command = Command(intent_guess.command)
+    if settings.CLASSIFIER_ENABLED:
+        get_classifier().record(text, command)
+    if command in (Command.CHAT, Command.MISS):
+        if intent_guess.reply is not None:
+            chat_message = intent_guess.reply
+            chat_conversation().add(channel_id, "user", text)
+            chat_conversation().add(channel_id, "assistant", chat_message)
+            if shown:
+                return
+        elif command == Command.MISS:
+            # A miss isn't worth a live completion, so it gets a pre-generated reply
+            chat_message = miss_reply()
+        elif buffer is not None:
+            await buffer.stream(
+                prefix,
+                stream_chat(text, channel_id),
+                edit_interval=settings.CHAT_STREAM_EDIT_INTERVAL,
             )
             return
-
-        if action_guess.command is Command.MISS:
-            logger.info(f"I got confused, I'm sorry. I thought the command was {command_guess.command}")
-            return
-
-        logger.info(f"> I chose this command: {command_guess.command}")
-        logger.info(f"> About why I chose this command: {command_guess.explanation}")
-
-        if command_guess.target is not None:
-            logger.debug(f"Trying to deduce the player from {command_guess.target}")
-            regex_match = re.search(r"<@(\d+)>", command_guess.target)
-            if regex_match is not None:
-                logger.debug("Target is a player id")
-                action_guess.target_id = int(regex_match.group(0))
-                logger.debug(f"Target id parsed as {action_guess.target_id=}")
-            else:
-                logger.debug("Target must be a name. Looking them up")
-                action_guess.target_id = player_id_map.get(command_guess.target)
-                if action_guess.target_id is None:
-                    logger.debug(f"No exact match. Going to try to guess the name")
-                    user_guess: UserGuess = guess_user(command_guess.target, list(player_id_map.keys()))
-                    logger.info(f"I chose {user_guess.name} as the target of the command")
-                    logger.info(f"> About why I chose this user: {user_guess.explanation}")
-                    logger.debug(f"Looking up {user_guess.name} in {', '.join(player_id_map.keys())}")
-                    action_guess.target_id = player_id_map.get(user_guess.name)
-                    if action_guess.target_id is None:
-                        logger.info(f"Well, shit...I can't guess who that is referring to. Sorry!")
+        else:
+            try:
+                chat_message = await get_chat(text, channel_id)
+            except AIError as err:
+                logger.debug(f"Couldn't get a chat reply: {err}")
+                chat_message = offline_reply()
+        logger.info(f"<@{action_guess.player_id}>, {chat_message}")
+        return
+
+    action_guess.command = command
+    logger.info(f"> I chose this command: {command}")
+    logger.info(f"> About why I chose this command: {intent_guess.explanation}")
+
+    if intent_guess.choice is not None:
+        if command == Command.CHOOSE_POISON:
+            try:
+                action_guess.choice = Poison(intent_guess.choice.upper())
+            except ValueError:
+                logger.info(f"I don't know what kind of poison {intent_guess.choice} is. Try truth, dare, or wyr!")
+                action_guess.command = None
+                return
+        else:
+            action_guess.choice = intent_guess.choice
+
+    if intent_guess.target_id is not None and intent_guess.target_id in member_index:
+        action_guess.target_id = intent_guess.target_id
+        logger.debug(f"Target id chosen as {action_guess.target_id=}")
+    elif intent_guess.target_name is not None:
+        logger.debug(f"Trying to deduce the player from {intent_guess.target_name}")
+        name_match = member_index.best(intent_guess.target_name)
+        logger.debug(f"Closest name to {intent_guess.target_name} is {name_match}")
+        if name_match is not None and name_match.score >= settings.NAME_MATCH_THRESHOLD:
+            action_guess.target_id = name_match.member_id
+        else:
+            logger.info(f"Well, shit...I can't guess who that is referring to. Sorry!")
@@ -0,0 +1,294 @@
+"""
+Drive ``MyClient.on_message`` with synthetic traffic and report per-stage latency.
+
+The Discord gateway is replaced by plain fake channels, members, and messages, and the AI
+backend is replaced by a stub with configurable latency, so no token or network is needed::
+
+    poetry run bench --messages 5000 --channels 50 --users 500 --ai-latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+
+EXACT_COMMANDS = ["join", "leave", "users", "status", "start", "finish", "check_players"]
+NATURAL_PHRASES = [
+    "I'm in!",
+    "deal me out",
+    "who's playing?",
+    "let's play",
+    "truth",
+    "dare",
+    "pick {name}",
+    "challenge {name}",
+    "count me in please",
+    "what's going on?",
+]
+CHATTER = [
+    "you're a very good boy",
+    "what do you think about cats?",
+    "tell me a joke",
+    "lol this bot is so dumb",
+    "I bet you can't even fetch",
+]
+
+
+@dataclass(eq=False)
+class FakeMember:
+    id: int
+    display_name: str
+    guild: "FakeGuild | None" = field(default=None, repr=False)
+
+    @property
+    def name(self):
+        return self.display_name
+
+    def __str__(self):
+        return self.display_name
+
+
+@dataclass(eq=False)
+class FakeGuild:
+    id: int
+    members: list[FakeMember] = field(default_factory=list, repr=False)
+
+    @property
+    def text_channels(self):
+        return []
+
+
+@dataclass(eq=False)
+class FakeSentMessage:
+    channel: "FakeChannel"
+    content: str
+    edits: int = 0
+
+    async def edit(self, content: str):
+        await asyncio.sleep(self.channel.send_latency)
+        self.content = content
+        self.edits += 1
+
+
+@dataclass(eq=False)
+class FakeChannel:
+    id: int
+    guild: FakeGuild
+    send_latency: float = 0.0
+    sent: list[str] = field(default_factory=list)
+
+    @property
+    def members(self):
+        return self.guild.members
+
+    async def send(self, content: str):
+        await asyncio.sleep(self.send_latency)
+        self.sent.append(content)
+        return FakeSentMessage(channel=self, content=content)
+
+    def __str__(self):
+        return f"#{self.id}"
+
+
+@dataclass(eq=False)
+class FakeMessage:
+    author: FakeMember
+    channel: FakeChannel
+    content: str
+    mentions: list[FakeMember]
+
+    @property
+    def guild(self):
+        return self.channel.guild
+
+
+class FakeBackend:
+    """
+    Stand in for the OpenAI chat completion endpoint with canned answers after a delay.
+    """
+
+    def __init__(self, latency: float, jitter: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    async def __call__(self, messages: list[dict], functions: list[dict] | None = None, stream: bool = False, **_):
+        from openai.openai_object import OpenAIObject
+
+        self.calls += 1
+        if stream:
+            return self.stream(functions)
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if functions is not None:
+            content = self.intent_arguments()
+            message = dict(role="assistant", content=None, function_call=dict(name=functions[0]["name"], arguments=content))
+        else:
+            content = "Woof. I have nothing nice to say about that."
+            message = dict(role="assistant", content=content)
+        return OpenAIObject.construct_from(
+            dict(
+                choices=[dict(message=message)],
+                usage=dict(prompt_tokens=len(str(messages)) // 4, completion_tokens=len(content) // 4),
+            )
+        )
+
+    def intent_arguments(self) -> str:
+        command = random.choice(["CHAT", "JOIN", "USERS", "MISS"])
+        arguments = dict(command=command, explanation="because the stub said so")
+        if command in ("CHAT", "MISS") and random.random() < 0.5:
+            arguments["reply"] = "Woof. I have nothing nice to say about that."
+        return json.dumps(arguments)
+
+    async def stream(self, functions: list[dict] | None):
+        from openai.openai_object import OpenAIObject
+
+        # The first token arrives after a fraction of the full latency, as it does for real
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)) / 4)
+        if functions is not None:
+            content = self.intent_arguments()
+            pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+            deltas = [dict(function_call=dict(arguments=piece)) for piece in pieces]
+        else:
+            deltas = [dict(content=f"{word} ") for word in "Woof. I have nothing nice to say about that.".split()]
+        for delta in deltas:
+            await asyncio.sleep(self.latency / 20)
+            yield OpenAIObject.construct_from(dict(choices=[dict(delta=delta)]))
+
+
+def build_world(args) -> tuple[FakeMember, list[FakeChannel]]:
+    bot_user = FakeMember(id=1, display_name="dogbot")
+    guilds = [FakeGuild(id=1000 + i) for i in range(args.guilds)]
+    for i in range(args.users):
+        guild = guilds[i % len(guilds)]
+        guild.members.append(FakeMember(id=10_000 + i, display_name=f"player{i}", guild=guild))
+    for guild in guilds:
+        bot_user.guild = guild
+        guild.members.append(bot_user)
+    channels = [
+        FakeChannel(id=100_000 + i, guild=guilds[i % len(guilds)], send_latency=args.send_latency)
+        for i in range(args.channels)
+    ]
+    return (bot_user, channels)
+
+
+def make_message(args, bot_user: FakeMember, channels: list[FakeChannel]) -> FakeMessage:
+    channel = random.choice(channels)
+    players = [m for m in channel.members if m is not bot_user]
+    author = random.choice(players)
+    kind = random.choices(["exact", "natural", "chatter"], weights=args.mix)[0]
+    if kind == "exact":
+        text = random.choice(EXACT_COMMANDS)
+    elif kind == "natural":
+        text = random.choice(NATURAL_PHRASES).format(name=random.choice(players).display_name)
+    else:
+        text = random.choice(CHATTER)
+    return FakeMessage(
+        author=author,
+        channel=channel,
+        content=f"<@{bot_user.id}> {text}",
+        mentions=[bot_user],
+    )
+
+
+def print_report(elapsed: float, count: int, backend: FakeBackend, client):
+    from bot import metrics
+
+    print(f"\nHandled {count} messages in {elapsed:.2f}s ({count / elapsed:.1f} msg/s)")
+    print(f"AI calls: {backend.calls}, command parsing: {client.parse_stats}")
+    dropped = sum(metrics.ingest_dropped.values.values())
+    coalesced = sum(metrics.ingest_coalesced.values.values())
+    print(f"Dropped by the ingest queue: {dropped:.0f}, coalesced: {coalesced:.0f}")
+    print(f"Throttled AI fallbacks: {metrics.parses.get(result='throttled'):.0f}")
+    print(f"\n{'stage':<26}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for (stage, stats) in sorted(metrics.summarize().items()):
+        print(
+            f"{stage:<26}{stats['count']:>8}"
+            + "".join(f"{stats[k] * 1000:>10.2f}" for k in ("mean", "p50", "p95", "p99"))
+        )
+
+
+async def drive(args):
+    from bot import completions, metrics
+    from bot.main import MyClient, make_intents
+
+    backend = FakeBackend(latency=args.ai_latency, jitter=args.ai_jitter)
+    completions.set_backend(backend)
+
+    (bot_user, channels) = build_world(args)
+    client = MyClient(intents=make_intents())
+    client._connection.user = bot_user
+    await client.setup_hook()
+    client.members.exclude(bot_user.id)
+
+    messages = [make_message(args, bot_user, channels) for _ in range(args.messages)]
+    limiter = asyncio.Semaphore(args.concurrency)
+
+    async def _handle(message):
+        async with limiter:
+            await client.on_message(message)
+
+    metrics.reset()
+    start = time.perf_counter()
+    await asyncio.gather(*(_handle(m) for m in messages))
+    await client.ingest.join()
+    await client.ingest.close()
+    await client.store.close()
+    await client.ordeals.close()
+    await client.replies.close()
+
+    # Let the chat buffers that were scheduled to flush finish sending
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    if len(pending) > 0:
+        await asyncio.wait(pending)
+    elapsed = time.perf_counter() - start
+
+    print_report(elapsed, len(messages), backend, client)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Load test the bot's message handling offline")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100, help="Messages in flight at once")
+    parser.add_argument("--ai-latency", type=float, default=0.2, help="Mean stub AI latency in seconds")
+    parser.add_argument("--ai-jitter", type=float, default=0.05)
+    parser.add_argument("--send-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--mix",
+        type=lambda text: [float(w) for w in text.split(":")],
+        default=[0.4, 0.4, 0.2],
+        help="Relative weights of exact:natural:chatter messages",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="dogbot-bench-")
+    os.environ["METRICS_ENABLED"] = "false"
+
+    # bot.main configures its own logging on import, so quiet it down afterwards
+    import bot.main  # noqa: F401
+    from bot.output import CHAT_LEVEL, chat_sink
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    logger.add(chat_sink, level=CHAT_LEVEL)
+
+    asyncio.run(drive(args))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,76 @@
+import time
+
+from loguru import logger
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing service for a while after too many failures in a row.
+
+    The breaker starts closed and lets every call through. After ``failure_threshold``
+    consecutive failures it opens and turns calls away until ``reset_timeout`` seconds have
+    passed. Then it lets a single probe through: if the probe succeeds the breaker closes,
+    otherwise it opens again for another ``reset_timeout``.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    @property
+    def is_open(self) -> bool:
+        """
+        Tell whether a call would be turned away right now, without claiming the probe.
+        """
+        state = self.state
+        return state == "open" or (state == "half_open" and self.probing)
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            logger.debug(f"Letting a probe through the {self.name} circuit breaker")
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.debug(f"Closing the {self.name} circuit breaker")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def release(self):
+        """
+        Give up the probe without a verdict, e.g. when the probing call was cancelled.
+        """
+        self.probing = False
+
+    def record_failure(self) -> bool:
+        """
+        Count a failed call and tell whether it tripped the breaker open.
+        """
+        self.failures += 1
+        if not self.probing and self.failures < self.failure_threshold:
+            return False
+
+        tripped = self.opened_at is None or self.probing
+        if tripped:
+            logger.debug(f"Opening the {self.name} circuit breaker after {self.failures} failure(s)")
+        self.opened_at = time.monotonic()
+        self.probing = False
+        return tripped
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable
+
+from loguru import logger
+
+from bot.metrics import cache_lookups
+
+
+def normalize(text: str) -> str:
+    """
+    Reduce a message to a canonical form so that trivially different phrasings share a key.
+
+    Case, punctuation, and repeated whitespace are dropped. Mentions like ``<@1234>`` are kept.
+    """
+    text = re.sub(r"[^\w<@>\s]", "", text.lower())
+    return " ".join(text.split())
+
+
+def roster_fingerprint(names: Iterable[str]) -> str:
+    digest = hashlib.sha1("\n".join(sorted(names)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class GuessCache:
+    """
+    Memoize AI guesses in an LRU cache with a TTL that is persisted to SQLite.
+
+    Lookups are served from memory. Every insert is written through to disk so the cache
+    survives restarts, and the most recently used entries are loaded back on startup.
+    """
+
+    def __init__(self, path: Path, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self.touched: dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS guesses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.load()
+
+    def load(self):
+        cutoff = time.time() - self.ttl
+        with self.db:
+            self.db.execute("DELETE FROM guesses WHERE created_at < ?", (cutoff,))
+            rows = self.db.execute(
+                "SELECT key, value, created_at FROM guesses ORDER BY accessed_at DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+        for (key, value, created_at) in reversed(rows):
+            self.entries[key] = (created_at, json.loads(value))
+        logger.debug(f"Loaded {len(self.entries)} cached guesses")
+
+    @staticmethod
+    def make_key(kind: str, text: str, roster_key: str) -> str:
+        return f"{kind}:{roster_key}:{normalize(text)}"
+
+    def get(self, kind: str, text: str, roster_key: str) -> dict[str, Any] | None:
+        key = self.make_key(kind, text, roster_key)
+        entry = self.entries.get(key)
+        now = time.time()
+        if entry is not None and now - entry[0] > self.ttl:
+            self.entries.pop(key)
+            self.touched.pop(key, None)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            cache_lookups.inc(kind=kind, result="miss")
+            logger.debug(f"Guess cache miss for {key=} ({self.report()})")
+            return None
+
+        self.entries.move_to_end(key)
+        self.touched[key] = now
+        self.hits += 1
+        cache_lookups.inc(kind=kind, result="hit")
+        logger.debug(f"Guess cache hit for {key=} ({self.report()})")
+        return entry[1]
+
+    def put(self, kind: str, text: str, roster_key: str, value: dict[str, Any]):
+        key = self.make_key(kind, text, roster_key)
+        now = time.time()
+        self.entries[key] = (now, value)
+        self.entries.move_to_end(key)
+        self.touched.pop(key, None)
+
+        evicted = []
+        while len(self.entries) > self.max_entries:
+            (stale_key, _) = self.entries.popitem(last=False)
+            self.touched.pop(stale_key, None)
+            evicted.append((stale_key,))
+
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO guesses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self.db.executemany("DELETE FROM guesses WHERE key = ?", evicted)
+        self.flush()
+
+    def flush(self):
+        """
+        Persist the access times of entries that have been read since the last flush.
+        """
+        if len(self.touched) == 0:
+            return
+        with self.db:
+            self.db.executemany(
+                "UPDATE guesses SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for (key, accessed_at) in self.touched.items()],
+            )
+        self.touched.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return 0.0 if total == 0 else self.hits / total
+
+    def report(self) -> str:
+        return f"hits={self.hits}, misses={self.misses}, ratio={self.hit_ratio:.2f}, size={len(self.entries)}"
+
+    def close(self):
+        self.flush()
+        logger.debug(f"Closing guess cache: {self.report()}")
+        self.db.close()
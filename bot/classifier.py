@@ -0,0 +1,197 @@
+import asyncio
+import math
+import sqlite3
+import time
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Iterable
+
+from loguru import logger
+
+from bot.constants import Command
+from bot.grammar import normalize
+from bot.metrics import observe
+
+
+NGRAM_SIZES = (3, 4, 5)
+
+
+def features(text: str) -> dict[str, float]:
+    """
+    Turn a message into sublinear term frequencies of the character n-grams of its words.
+
+    Each word is padded with spaces so that n-grams at the start and end of words are
+    distinct from those in the middle. Mentions are reduced to "@" by ``normalize``.
+    """
+    grams = Counter()
+    for word in normalize(text).split():
+        padded = f" {word} "
+        for size in NGRAM_SIZES:
+            if len(padded) < size:
+                continue
+            grams.update(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return {gram: 1.0 + math.log(count) for (gram, count) in grams.items()}
+
+
+def _unit(vector: dict[str, float]) -> dict[str, float]:
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if norm == 0.0:
+        return {}
+    return {gram: weight / norm for (gram, weight) in vector.items()}
+
+
+class Index:
+    """
+    A TF-IDF index of labelled examples that finds the nearest example by cosine similarity.
+
+    Vectors are sparse, so each document is stored in the postings of its n-grams and a query
+    only touches the documents that share at least one n-gram with it.
+    """
+
+    def __init__(self, examples: list[tuple[str, Command]]):
+        vectors = [features(text) for (text, _) in examples]
+        document_frequency = Counter(gram for vector in vectors for gram in vector)
+        total = len(vectors)
+        self.idf = {
+            gram: math.log((1 + total) / (1 + count)) + 1.0
+            for (gram, count) in document_frequency.items()
+        }
+        self.labels = [command for (_, command) in examples]
+        self.postings: dict[str, list[tuple[int, float]]] = defaultdict(list)
+        for (doc, vector) in enumerate(vectors):
+            weighted = _unit({gram: weight * self.idf[gram] for (gram, weight) in vector.items()})
+            for (gram, weight) in weighted.items():
+                self.postings[gram].append((doc, weight))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def vectorize(self, text: str) -> dict[str, float]:
+        # n-grams that never appeared in training can't match anything, so they are dropped
+        vector = {gram: weight * self.idf[gram] for (gram, weight) in features(text).items() if gram in self.idf}
+        return _unit(vector)
+
+    def nearest(self, text: str, allowed: set[Command] | None = None) -> tuple[Command | None, float]:
+        scores: dict[int, float] = defaultdict(float)
+        for (gram, weight) in self.vectorize(text).items():
+            for (doc, doc_weight) in self.postings[gram]:
+                scores[doc] += weight * doc_weight
+
+        best = (None, 0.0)
+        for (doc, score) in scores.items():
+            label = self.labels[doc]
+            if score > best[1] and (allowed is None or label in allowed):
+                best = (label, score)
+        return best
+
+
+class IntentClassifier:
+    """
+    Learn to recognize commands from the AI's own past decisions.
+
+    Every message the AI interprets is recorded with the command it chose, keyed by its
+    normalized text so that repeats don't crowd out variety. Examples are written through to
+    SQLite and the most recent ``max_examples`` are kept. The index is rebuilt in a thread
+    once ``retrain_every`` new examples have come in; until there are ``min_examples`` it
+    doesn't classify anything.
+    """
+
+    def __init__(self, path: Path, max_examples: int, min_examples: int, retrain_every: int):
+        self.max_examples = max_examples
+        self.min_examples = min_examples
+        self.retrain_every = retrain_every
+        self.examples: OrderedDict[str, Command] = OrderedDict()
+        self.index: Index | None = None
+        self.added = 0
+        self.training: asyncio.Task | None = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS examples (
+                text TEXT PRIMARY KEY,
+                command TEXT NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+            """
+        )
+        self.load()
+
+    def load(self):
+        rows = self.db.execute(
+            "SELECT text, command FROM examples ORDER BY recorded_at DESC LIMIT ?",
+            (self.max_examples,),
+        ).fetchall()
+        for (text, command) in reversed(rows):
+            self.examples[text] = Command(command)
+        self.added = len(self.examples)
+        logger.debug(f"Loaded {len(self.examples)} intent examples")
+
+    def record(self, text: str, command: Command):
+        key = normalize(text)
+        if key == "":
+            return
+        if self.examples.get(key) != command:
+            self.added += 1
+        self.examples[key] = command
+        self.examples.move_to_end(key)
+
+        evicted = []
+        while len(self.examples) > self.max_examples:
+            (stale_key, _) = self.examples.popitem(last=False)
+            evicted.append((stale_key,))
+
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO examples (text, command, recorded_at) VALUES (?, ?, ?)",
+                (key, str(command), time.time()),
+            )
+            self.db.executemany("DELETE FROM examples WHERE text = ?", evicted)
+
+    def maybe_retrain(self):
+        if self.training is not None or len(self.examples) < self.min_examples:
+            return
+        if self.index is not None and self.added < self.retrain_every:
+            return
+        self.training = asyncio.create_task(self.retrain())
+
+    async def retrain(self):
+        try:
+            examples = list(self.examples.items())
+            self.added = 0
+            started_at = time.perf_counter()
+            self.index = await asyncio.to_thread(Index, examples)
+            observe("classifier_train", time.perf_counter() - started_at)
+            logger.debug(f"Trained the intent classifier on {len(examples)} examples")
+        except Exception as err:
+            logger.exception(f"Failed to train the intent classifier: {err}")
+        finally:
+            self.training = None
+
+    def classify_many(
+        self,
+        texts: Iterable[str],
+        allowed: set[Command] | None = None,
+    ) -> list[tuple[Command | None, float]]:
+        """
+        Find the command of the most similar known example for each text, and how similar it is.
+
+        Only examples labelled with one of the ``allowed`` commands are considered.
+        """
+        self.maybe_retrain()
+        index = self.index
+        if index is None:
+            return [(None, 0.0) for _ in texts]
+        return [index.nearest(text, allowed) for text in texts]
+
+    def classify(self, text: str, allowed: set[Command] | None = None) -> tuple[Command | None, float]:
+        return self.classify_many([text], allowed)[0]
+
+    def close(self):
+        if self.training is not None:
+            self.training.cancel()
+        logger.debug(f"Closing intent classifier with {len(self.examples)} examples")
+        self.db.close()
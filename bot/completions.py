@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable
+
+from loguru import logger
+
+from bot.breaker import CircuitBreaker
+from bot.config import settings
+from bot.exceptions import AIError, AITimeout, AITransientError, AIUnavailable
+from bot.metrics import ai_breaker_trips, ai_requests, ai_retries, ai_tokens, observe, span
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+_openai: ModuleType | None = None
+_session: aiohttp.ClientSession | None = None
+_semaphore: asyncio.Semaphore | None = None
+_breaker: CircuitBreaker | None = None
+
+
+def get_openai() -> ModuleType:
+    """
+    Import and configure the OpenAI client on first use, because importing it is slow.
+    """
+    global _openai
+    if _openai is None:
+        import openai
+
+        openai.api_key = settings.OPENAI_API_KEY
+        if settings.OPENAI_API_BASE is not None:
+            openai.api_base = settings.OPENAI_API_BASE
+        _openai = openai
+    return _openai
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Get the shared keep-alive HTTP session used for every AI request.
+
+    The session is created lazily because it has to be built inside a running event loop.
+    """
+    import aiohttp
+
+    global _session
+    if _session is None or _session.closed:
+        logger.debug("Opening pooled AI http session")
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.AI_MAX_CONNECTIONS,
+                keepalive_timeout=settings.AI_KEEPALIVE_TIMEOUT,
+            ),
+        )
+    return _session
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.AI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def get_breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(
+            "AI",
+            failure_threshold=settings.AI_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.AI_BREAKER_RESET_TIMEOUT,
+        )
+    return _breaker
+
+
+async def openai_backend(**kwargs):
+    openai = get_openai()
+    openai.aiosession.set(get_session())
+    return await openai.ChatCompletion.acreate(**kwargs)
+
+
+Backend = Callable[..., Awaitable[Any]]
+backend: Backend = openai_backend
+
+
+def set_backend(new_backend: Backend):
+    """
+    Replace the function that performs chat completion requests, e.g. with a stub for benchmarks.
+    """
+    global backend
+    backend = new_backend
+
+
+def retryable_errors() -> tuple[type[Exception], ...]:
+    error = get_openai().error
+    return (
+        error.APIConnectionError,
+        error.APIError,
+        error.RateLimitError,
+        error.ServiceUnavailableError,
+        error.Timeout,
+        error.TryAgain,
+    )
+
+
+def openai_error() -> type[Exception]:
+    return get_openai().error.OpenAIError
+
+
+def backoff(attempt: int) -> float:
+    """
+    Pick a delay before retry number ``attempt`` using exponential backoff with full jitter.
+    """
+    ceiling = min(settings.AI_RETRY_MAX_DELAY, settings.AI_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+async def attempt(messages: list[dict], stage: str, timeout: float, **kwargs):
+    async with get_semaphore():
+        try:
+            response = await asyncio.wait_for(
+                backend(
+                    model=settings.AI_MODEL,
+                    messages=messages,
+                    **kwargs,
+                ),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            ai_requests.inc(stage=stage, outcome="timeout")
+            raise AITimeout(f"AI request timed out after {timeout:.1f} seconds")
+        except retryable_errors() as err:
+            ai_requests.inc(stage=stage, outcome="error")
+            raise AITransientError(f"AI request failed: {err}")
+        except openai_error() as err:
+            ai_requests.inc(stage=stage, outcome="error")
+            raise AIError(f"AI request failed: {err}")
+
+    ai_requests.inc(stage=stage, outcome="ok")
+    usage = response.get("usage")
+    if usage is not None:
+        ai_tokens.inc(usage.get("prompt_tokens", 0), stage=stage, kind="prompt")
+        ai_tokens.inc(usage.get("completion_tokens", 0), stage=stage, kind="completion")
+    return response
+
+
+async def complete(messages: list[dict], stage: str = "complete", **kwargs):
+    """
+    Request a chat completion without blocking the event loop.
+
+    At most ``AI_MAX_CONCURRENCY`` requests are in flight at once. Each attempt is abandoned
+    after ``AI_TIMEOUT`` seconds, transient failures are retried with jittered backoff up to
+    ``AI_MAX_RETRIES`` times, and the whole call gives up once ``AI_DEADLINE`` seconds have
+    passed. Repeated failures open a circuit breaker, after which calls fail fast with
+    ``AIUnavailable`` until the provider recovers. The time taken is recorded under ``stage``.
+    """
+    breaker = get_breaker()
+    AIUnavailable.require_condition(breaker.allow(), "AI circuit breaker is open")
+
+    with span(stage):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.AI_DEADLINE
+        tries = 0
+        while True:
+            timeout = min(settings.AI_TIMEOUT, deadline - loop.time())
+            try:
+                response = await attempt(messages, stage, timeout, **kwargs)
+            except AITransientError as err:
+                tries += 1
+                delay = backoff(tries)
+                if tries > settings.AI_MAX_RETRIES or loop.time() + delay >= deadline:
+                    if breaker.record_failure():
+                        ai_breaker_trips.inc()
+                    raise
+                logger.debug(f"Retrying {stage} in {delay:.2f}s after: {err}")
+                ai_retries.inc(stage=stage)
+                await asyncio.sleep(delay)
+            except AIError:
+                # The provider answered, so it is up even though it rejected this request
+                breaker.record_success()
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+                return response
+
+
+async def stream(messages: list[dict], stage: str = "stream", **kwargs) -> AsyncIterator[str]:
+    """
+    Request a streaming chat completion and yield the text of each chunk as it arrives.
+
+    If the request calls a function, the text is that of the function's JSON arguments.
+
+    The circuit breaker and concurrency limit apply as for ``complete``, and the wait for each
+    chunk is limited to ``AI_TIMEOUT`` seconds. A stream is not retried, because part of it may
+    already have been shown. The time to the first chunk is recorded under ``<stage>_first_token``.
+    """
+    breaker = get_breaker()
+    AIUnavailable.require_condition(breaker.allow(), "AI circuit breaker is open")
+
+    with span(stage):
+        start = time.perf_counter()
+        async with get_semaphore():
+            try:
+                chunks = await asyncio.wait_for(
+                    backend(
+                        model=settings.AI_MODEL,
+                        messages=messages,
+                        stream=True,
+                        **kwargs,
+                    ),
+                    timeout=settings.AI_TIMEOUT,
+                )
+                first = True
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(anext(chunks), timeout=settings.AI_TIMEOUT)
+                    except StopAsyncIteration:
+                        break
+                    if first:
+                        observe(f"{stage}_first_token", time.perf_counter() - start)
+                        first = False
+                    delta = chunk.choices[0].delta
+                    # A function call streams its arguments instead of content
+                    text = delta.get("content") or (delta.get("function_call") or {}).get("arguments")
+                    if text:
+                        yield text
+            except asyncio.TimeoutError:
+                ai_requests.inc(stage=stage, outcome="timeout")
+                if breaker.record_failure():
+                    ai_breaker_trips.inc()
+                raise AITimeout(f"AI stream stalled for {settings.AI_TIMEOUT} seconds")
+            except retryable_errors() as err:
+                ai_requests.inc(stage=stage, outcome="error")
+                if breaker.record_failure():
+                    ai_breaker_trips.inc()
+                raise AITransientError(f"AI stream failed: {err}")
+            except openai_error() as err:
+                ai_requests.inc(stage=stage, outcome="error")
+                breaker.record_success()
+                raise AIError(f"AI stream failed: {err}")
+            except BaseException:
+                breaker.release()
+                raise
+
+    ai_requests.inc(stage=stage, outcome="ok")
+    breaker.record_success()
+
+
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        logger.debug("Closing pooled AI http session")
+        await _session.close()
+    _session = None
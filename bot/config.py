@@ -1,22 +1,32 @@
-from pydantic_settings import BaseSettings
+from typing import TYPE_CHECKING
 
-from bot.constants import LogLevelEnum
+if TYPE_CHECKING:
+    from bot.settings import Settings
 
 
-class Settings(BaseSettings):
+class LazySettings:
     """
-    Provide a pydantic ``BaseSettings`` model for the application settings.
+    Stand in for ``Settings`` and only read the environment when a setting is first used.
+
+    This keeps importing modules that refer to the settings cheap, e.g. for tests and benchmarks.
     """
 
-    DEPLOY_ENV: str = "LOCAL"
+    def __init__(self):
+        object.__setattr__(self, "_settings", None)
+
+    def load(self) -> "Settings":
+        if self._settings is None:
+            # pydantic is slow to import, so the model is only imported when it is needed
+            from bot.settings import Settings
 
-    LOG_LEVEL: LogLevelEnum = LogLevelEnum.DEBUG
+            object.__setattr__(self, "_settings", Settings())
+        return self._settings
 
-    DISCORD_TOKEN: str
-    OPENAI_API_KEY: str
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
 
-    class Config:
-        env_file = ".env"
+    def __setattr__(self, name, value):
+        setattr(self.load(), name, value)
 
 
-settings = Settings()
+settings: "Settings" = LazySettings()
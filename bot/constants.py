@@ -2,6 +2,9 @@ from auto_name_enum import AutoNameEnum, auto
 
 PLAYERS_REQUIRED_TO_PLAY = 1
 BOT_NAME = "dogbot"
+DISCORD_MESSAGE_LIMIT = 2000
+SEND_ATTEMPTS = 3
+STREAM_PLACEHOLDER = " …"
 
 
 class LogLevelEnum(AutoNameEnum):
@@ -28,6 +31,11 @@ class Poison(AutoNameEnum):
     DARE = auto()
     WYR = auto()
 
+class ReplyKind(AutoNameEnum):
+    MISS = auto()
+    THROTTLED = auto()
+
+
 class Command(AutoNameEnum):
     START = auto()
     FINISH = auto()
@@ -0,0 +1,125 @@
+from collections import OrderedDict, deque
+
+from loguru import logger
+
+
+def estimate_tokens(content: str) -> int:
+    """
+    Estimate the number of tokens in a message.
+
+    OpenAI models average about four characters per token for English text. A few tokens are
+    added for the per-message overhead of the chat format.
+    """
+    return len(content) // 4 + 4
+
+
+class Conversation:
+    """
+    Keep a bounded history of AI messages for each channel.
+
+    Every request is built from a fixed system prefix, an optional summary of older turns, and
+    a sliding window of the most recent turns in the channel. The window is trimmed from the
+    oldest end until it fits within ``token_budget``. If ``summarize`` is set, trimmed turns are
+    kept aside so that they can be folded into the channel's summary.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        token_budget: int,
+        max_turns: int,
+        max_channels: int,
+        summarize: bool = False,
+    ):
+        self.prefix = [dict(role="system", content=system_prompt)]
+        self.prefix_tokens = estimate_tokens(system_prompt)
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.max_channels = max_channels
+        self.summarize = summarize
+        self.windows: OrderedDict[int, deque[dict]] = OrderedDict()
+        self.window_tokens: dict[int, int] = {}
+        self.summaries: dict[int, str] = {}
+        self.evicted: dict[int, list[dict]] = {}
+
+    def _window(self, channel_id: int) -> deque[dict]:
+        window = self.windows.get(channel_id)
+        if window is None:
+            window = deque()
+            self.windows[channel_id] = window
+            self.window_tokens[channel_id] = 0
+            while len(self.windows) > self.max_channels:
+                (stale_id, _) = self.windows.popitem(last=False)
+                self.window_tokens.pop(stale_id, None)
+                self.summaries.pop(stale_id, None)
+                self.evicted.pop(stale_id, None)
+                logger.debug(f"Dropped conversation history for channel {stale_id}")
+        else:
+            self.windows.move_to_end(channel_id)
+        return window
+
+    def _trim(self, channel_id: int, reserved_tokens: int = 0):
+        window = self.windows[channel_id]
+        budget = self.token_budget - self.prefix_tokens - reserved_tokens
+        summary = self.summaries.get(channel_id)
+        if summary is not None:
+            budget -= estimate_tokens(summary)
+
+        def _pop():
+            message = window.popleft()
+            self.window_tokens[channel_id] -= estimate_tokens(message["content"])
+            if self.summarize:
+                self.evicted.setdefault(channel_id, []).append(message)
+
+        # Always keep the newest message, even if it alone is over budget
+        while len(window) > 1 and (len(window) > self.max_turns or self.window_tokens[channel_id] > budget):
+            _pop()
+
+        # Don't lead the window with a reply to a message that was just trimmed
+        while len(window) > 1 and window[0]["role"] == "assistant":
+            _pop()
+
+    def add(self, channel_id: int, role: str, content: str):
+        window = self._window(channel_id)
+        window.append(dict(role=role, content=content))
+        self.window_tokens[channel_id] += estimate_tokens(content)
+        self._trim(channel_id)
+
+    def messages(self, channel_id: int, *extra_system: str) -> list[dict]:
+        """
+        Build the message list for a request in the given channel.
+
+        Any ``extra_system`` prompts are appended after the history for this request only.
+        """
+        extra = [dict(role="system", content=text) for text in extra_system]
+        window = self._window(channel_id)
+        self._trim(channel_id, reserved_tokens=sum(estimate_tokens(m["content"]) for m in extra))
+
+        messages = list(self.prefix)
+        summary = self.summaries.get(channel_id)
+        if summary is not None:
+            messages.append(dict(role="system", content=f"Summary of the earlier conversation: {summary}"))
+        messages.extend(window)
+        messages.extend(extra)
+        return messages
+
+    def pop_evicted(self, channel_id: int) -> list[dict]:
+        return self.evicted.pop(channel_id, [])
+
+    def set_summary(self, channel_id: int, summary: str):
+        self.summaries[channel_id] = summary
+        if channel_id in self.windows:
+            self._trim(channel_id)
+
+    def adopt(self, other: "Conversation"):
+        """
+        Take over the history of another conversation, e.g. one built before a hot reload.
+
+        The system prompt and limits of this conversation are kept.
+        """
+        self.windows = other.windows
+        self.window_tokens = other.window_tokens
+        self.summaries = other.summaries
+        self.evicted = other.evicted if self.summarize else {}
+        for channel_id in list(self.windows):
+            self._trim(channel_id)
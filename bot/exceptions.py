@@ -1,13 +1,23 @@
 from buzz import Buzz
-from discord import Member
-
-from bot.constants import GameStatus, Command
 
 
 class BadCommandInterpretation(Buzz):
     pass
 
-class BadUserInterpretation(Buzz):
+
+class AIError(Buzz):
+    pass
+
+
+class AITransientError(AIError):
+    pass
+
+
+class AITimeout(AITransientError):
+    pass
+
+
+class AIUnavailable(AIError):
     pass
 
 
@@ -37,3 +47,7 @@ class NotJoinedError(StateError):
 
 class AlreadyHaveProberError(StateError):
     pass
+
+
+class NoTargetError(StateError):
+    pass
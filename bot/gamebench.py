@@ -0,0 +1,84 @@
+"""
+Measure how much memory each game takes and how long its transitions take.
+
+Many games are held at once, each with a few players, and every game is then played through
+a full round of the state machine. Nothing touches Discord or the AI::
+
+    poetry run gamebench --games 10000 --players 6
+"""
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from loguru import logger
+
+
+def play_round(game, player_ids: list[int], process_action, Action, Command, Poison) -> int:
+    (prober, victim) = (player_ids[0], player_ids[1])
+
+    def _act(command, player_id, target_id=None, choice=None):
+        process_action(Action(command=command, player_id=player_id, target_id=target_id, game=game, choice=choice))
+
+    _act(Command.START, prober)
+    _act(Command.PICK_PROBER, prober, target_id=prober)
+    _act(Command.CHOOSE_VICTIM, prober, target_id=victim)
+    _act(Command.CHOOSE_POISON, victim, choice=Poison.DARE)
+    _act(Command.CHOOSE_ORDEAL, prober, choice="bark like a dog")
+    _act(Command.CONFIRM, victim)
+    _act(Command.CONFIRM, victim)
+    _act(Command.CONFIRM, prober)
+    _act(Command.LEAVE, player_ids[-1])
+    _act(Command.JOIN, player_ids[-1])
+    _act(Command.USERS, prober)
+    return 11
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Benchmark the memory and transition cost of many games")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.players < 2:
+        parser.error("A round needs at least 2 players")
+
+    random.seed(args.seed)
+
+    # Every transition logs, so drop the handlers to time the state machine itself
+    logger.remove()
+
+    from bot.constants import Command, Poison
+    from bot.state_machine import process_action
+    from bot.types import Action, Game
+
+    rosters = [[random.getrandbits(62) for _ in range(args.players)] for _ in range(args.games)]
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    games = []
+    for player_ids in rosters:
+        game = Game()
+        for player_id in player_ids:
+            game.add_player(player_id)
+        games.append(game)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    transitions = 0
+    start = time.perf_counter()
+    for (game, player_ids) in zip(games, rosters):
+        transitions += play_round(game, player_ids, process_action, Action, Command, Poison)
+    elapsed = time.perf_counter() - start
+
+    print(f"Games: {len(games)} with {args.players} players each")
+    print(f"Memory: {allocated / 1024:.0f} KiB total, {allocated / len(games):.0f} bytes per game")
+    print(f"Transitions: {transitions} in {elapsed * 1000:.1f}ms, {elapsed / transitions * 1e6:.2f}µs each")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,203 @@
+import re
+from dataclasses import dataclass
+
+from loguru import logger
+
+from bot.constants import BOT_NAME, Command, Poison
+from bot.types import IntentMatch
+
+
+MENTION_PATTERN = re.compile(r"<@!?(?P<id>\d+)>")
+EXACT_PATTERN = re.compile(
+    r"^\s*{bot_name}\s+(?P<command>\w+)(?:\s+<@!?(?P<target_id>\d+)>)?\s*$".format(bot_name=BOT_NAME),
+    re.IGNORECASE,
+)
+
+# Words that carry no intent and shouldn't count against a phrase match
+FILLER_WORDS = frozenset(
+    """
+    a an the please pls plz now ok okay hey hi yo dude bro buddy i me my we us you to
+    lets let want wanna like go ahead just game
+    """.split()
+)
+
+# Words that flip or hedge the meaning of a phrase, unless they are the phrase itself
+NEGATION_WORDS = frozenset("no not dont never cant wont".split())
+
+MATCHED_CONFIDENCE = 0.95
+EXACT_CONFIDENCE = 1.0
+LEFTOVER_PENALTY = 0.15
+AMBIGUOUS_CONFIDENCE = 0.4
+NEGATED_CONFIDENCE = 0.4
+
+# Commands that can't be carried out without a target member or a choice
+NEEDS_TARGET = frozenset({Command.ENLIST, Command.CHOOSE_VICTIM})
+NEEDS_CHOICE = frozenset({Command.CHOOSE_POISON, Command.CHOOSE_ORDEAL})
+
+
+# A target slot in a phrase matches a mention or a single word that could be a display name
+TARGET_SLOT = r"(?P<target>@|(?!(?:me|you|us|the|a|game|prober|victim|players|truth|dare|wyr)\b)[\w.-]+)"
+
+
+@dataclass
+class Rule:
+    command: Command
+    patterns: list[re.Pattern]
+    choice: Poison | None = None
+    takes_text: bool = False
+
+
+def _rule(command: Command, *phrases: str, **kwargs) -> Rule:
+    patterns = [re.compile(r"(?<![\w@]){}(?![\w@])".format(p.replace("@", TARGET_SLOT))) for p in phrases]
+    return Rule(command=command, patterns=patterns, **kwargs)
+
+
+# Phrases are matched against the normalized text: lowercased, without punctuation or
+# apostrophes, and with every mention replaced by "@". An "@" in a phrase is a target slot.
+RULES: list[Rule] = [
+    _rule(Command.START, r"start(?: (?:a|the|new))?(?: game)?", r"begin", r"new game", r"lets play"),
+    _rule(Command.FINISH, r"finish", r"end(?: the)? game", r"stop(?: the)? game", r"game over"),
+    _rule(Command.CONFIRM, r"confirm", r"yes", r"yep", r"yeah", r"yup", r"accept(?:ed)?", r"agreed?", r"done", r"did it"),
+    _rule(Command.DENY, r"deny", r"no", r"nope", r"nah", r"reject", r"refuse"),
+    _rule(Command.JOIN, r"join(?: the game)?", r"im in", r"i am in", r"count me in", r"deal me in", r"let me play"),
+    _rule(Command.ENLIST, r"enlist @", r"add @", r"sign up @", r"deal @ in"),
+    _rule(Command.LEAVE, r"leave(?: the game)?", r"im out", r"i am out", r"count me out", r"deal me out", r"i quit"),
+    _rule(Command.USERS, r"users", r"players", r"whos playing", r"who is playing", r"who is in", r"whos in"),
+    _rule(Command.STATUS, r"status", r"help", r"whats going on", r"what now", r"whats next"),
+    _rule(
+        Command.CHOOSE_VICTIM,
+        r"choose victim @",
+        r"challenge @",
+        r"pick @",
+        r"choose @",
+        r"victim is @",
+        r"@ is next",
+        r"@ goes next",
+    ),
+    _rule(Command.CHOOSE_POISON, r"truth", choice=Poison.TRUTH),
+    _rule(Command.CHOOSE_POISON, r"dare", choice=Poison.DARE),
+    _rule(Command.CHOOSE_POISON, r"wyr", r"would you rather", choice=Poison.WYR),
+    _rule(Command.CHOOSE_ORDEAL, r"ordeal", r"i dare you to", r"tell us", r"would you rather", takes_text=True),
+    _rule(Command.SKIP, r"skip", r"pass", r"forfeit"),
+    _rule(Command.CHECK_PLAYERS, r"check players", r"enough players"),
+    _rule(Command.CHECK_PROBER, r"check prober"),
+    _rule(Command.CHECK_VICTIM, r"check victim"),
+    _rule(Command.PICK_PROBER, r"pick prober", r"random prober", r"pick @", r"@ probes next"),
+]
+
+ORDEAL_TEXT_PATTERN = re.compile(
+    r"(?:ordeal\s*:?|i dare you to|tell us|would you rather)\s+(?P<text>.+)$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def normalize(text: str) -> str:
+    text = MENTION_PATTERN.sub(" @ ", text.lower())
+    text = text.replace("'", "").replace("’", "")
+    text = re.sub(r"[^\w@\s]", " ", text)
+    return " ".join(word for word in text.split() if word != BOT_NAME)
+
+
+def _leftover_words(normalized: str, regex_match: re.Match) -> list[str]:
+    remainder = f"{normalized[:regex_match.start()]} {normalized[regex_match.end():]}".split()
+    return [word for word in remainder if word not in FILLER_WORDS and word != "@"]
+
+
+def _search(rule: Rule, normalized: str) -> re.Match | None:
+    for pattern in rule.patterns:
+        regex_match = pattern.search(normalized)
+        if regex_match is not None:
+            return regex_match
+    return None
+
+
+def _parse_exact(text: str) -> IntentMatch | None:
+    regex_match = EXACT_PATTERN.match(text)
+    if regex_match is None:
+        return None
+    command = Command(regex_match.group("command").upper())
+    if command is Command.MISS or command in NEEDS_CHOICE:
+        return None
+    target_id = regex_match.group("target_id")
+    if target_id is None and command in NEEDS_TARGET:
+        return None
+    return IntentMatch(
+        command=command,
+        target_id=None if target_id is None else int(target_id),
+        confidence=EXACT_CONFIDENCE,
+    )
+
+
+def parse_intent(text: str, available: set[Command] | None = None) -> IntentMatch:
+    """
+    Resolve a message to a command using the local grammar.
+
+    If ``available`` is given, commands outside of it are ignored. This is how phrasings like
+    "pick @someone" are resolved to PICK_PROBER or CHOOSE_VICTIM depending on the game status.
+    The returned confidence is between 0 and 1. A confidence of 0 means nothing matched.
+    """
+    match = _parse_exact(text)
+    if match is not None and (available is None or match.command in available):
+        return match
+
+    mention_ids = [int(m.group("id")) for m in MENTION_PATTERN.finditer(text)]
+    normalized = normalize(text)
+
+    candidates: list[IntentMatch] = []
+    for rule in RULES:
+        if available is not None and rule.command not in available:
+            continue
+        regex_match = _search(rule, normalized)
+        if regex_match is None:
+            continue
+
+        match = IntentMatch(command=rule.command, choice=rule.choice)
+        if rule.takes_text:
+            ordeal_match = ORDEAL_TEXT_PATTERN.search(text)
+            if ordeal_match is None:
+                continue
+            match.choice = ordeal_match.group("text").strip()
+            match.confidence = MATCHED_CONFIDENCE
+        else:
+            leftover = _leftover_words(normalized, regex_match)
+            # A question asks about the command rather than giving it, so it counts against the match
+            penalties = len(leftover) + ("?" in text)
+            match.confidence = round(max(0.0, MATCHED_CONFIDENCE - LEFTOVER_PENALTY * penalties), 2)
+            if any(word in NEGATION_WORDS for word in leftover):
+                match.confidence = min(match.confidence, NEGATED_CONFIDENCE)
+
+        target = regex_match.groupdict().get("target")
+        if len(mention_ids) > 0:
+            match.target_id = mention_ids[0]
+        elif target is not None:
+            match.target_name = target
+
+        candidates.append(match)
+
+    if len(candidates) == 0:
+        return IntentMatch(confidence=0.0)
+
+    candidates.sort(key=lambda m: m.confidence, reverse=True)
+    best = candidates[0]
+    if any(c.command is not best.command and c.confidence >= best.confidence for c in candidates[1:]):
+        logger.debug(f"Grammar found ambiguous commands: {[c.command for c in candidates]}")
+        best.confidence = min(best.confidence, AMBIGUOUS_CONFIDENCE)
+    return best
+
+
+@dataclass
+class ParseStats:
+    local_hits: int = 0
+    classifier_hits: int = 0
+    ai_fallbacks: int = 0
+
+    @property
+    def local_hit_ratio(self) -> float:
+        total = self.local_hits + self.classifier_hits + self.ai_fallbacks
+        return 0.0 if total == 0 else (self.local_hits + self.classifier_hits) / total
+
+    def __str__(self):
+        return (
+            f"local_hits={self.local_hits}, classifier_hits={self.classifier_hits}, "
+            f"ai_fallbacks={self.ai_fallbacks}, ratio={self.local_hit_ratio:.2f}"
+        )
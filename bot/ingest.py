@@ -0,0 +1,176 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+
+from bot.metrics import ingest_coalesced, ingest_dropped, observe
+
+
+@dataclass(eq=False)
+class Item:
+    id: int
+    channel_id: int
+    message: Any
+    urgent: bool
+    sender_id: int | None = None
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class IngestQueue:
+    """
+    Buffer incoming messages and hand them to a pool of workers.
+
+    Messages in the same channel are handled one at a time in the order they arrived, while
+    different channels are handled in parallel. Channels whose next message is urgent are
+    served before the rest. The queue holds at most ``max_size`` messages: when it is full, the
+    oldest message that isn't urgent is shed to make room, and if every queued message is urgent
+    the new one is turned away instead.
+
+    A message that isn't urgent is folded into the message waiting right before it in the same
+    channel with ``merge`` if both came from the same sender within ``coalesce_window`` seconds,
+    so that a burst of chatter is interpreted once.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        workers: int,
+        handle: Callable[[Any], Awaitable[None]],
+        drop: Callable[[Any, bool], None],
+        merge: Callable[[Any, Any], None],
+        coalesce_window: float,
+    ):
+        self.max_size = max_size
+        self.worker_count = workers
+        self.handle = handle
+        self.drop = drop
+        self.merge = merge
+        self.coalesce_window = coalesce_window
+        self.ids = itertools.count()
+        self.channels: dict[int, deque[Item]] = {}
+        self.scheduled: set[int] = set()
+        self.urgent_ready: deque[int] = deque()
+        self.ready: deque[int] = deque()
+        self.ready_count: asyncio.Semaphore | None = None
+        self.shedable: dict[int, Item] = {}
+        self.size = 0
+        self.busy = 0
+        self.idle: asyncio.Event | None = None
+        self.workers: list[asyncio.Task] = []
+
+    def __len__(self):
+        return self.size
+
+    def start(self):
+        self.ready_count = asyncio.Semaphore(0)
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.workers = [asyncio.create_task(self.work()) for _ in range(self.worker_count)]
+
+    def put(self, channel_id: int, message: Any, urgent: bool, sender_id: int | None = None) -> bool:
+        if self.coalesce(channel_id, message, urgent, sender_id):
+            return True
+
+        if self.size >= self.max_size and not self.shed():
+            logger.debug(f"Ingest queue is full of urgent messages. Turning away a message in {channel_id=}")
+            ingest_dropped.inc(reason="rejected", urgent=urgent)
+            self.drop(message, urgent)
+            return False
+
+        item = Item(id=next(self.ids), channel_id=channel_id, message=message, urgent=urgent, sender_id=sender_id)
+        self.channels.setdefault(channel_id, deque()).append(item)
+        if not urgent:
+            self.shedable[item.id] = item
+        self.size += 1
+        self.idle.clear()
+        if channel_id not in self.scheduled:
+            self.schedule(channel_id)
+        return True
+
+    def coalesce(self, channel_id: int, message: Any, urgent: bool, sender_id: int | None) -> bool:
+        queue = self.channels.get(channel_id)
+        if urgent or sender_id is None or not queue:
+            return False
+        last = queue[-1]
+        if last.urgent or last.sender_id != sender_id:
+            return False
+        if time.perf_counter() - last.queued_at > self.coalesce_window:
+            return False
+        logger.debug(f"Coalescing a message from {sender_id=} in {channel_id=}")
+        self.merge(last.message, message)
+        ingest_coalesced.inc()
+        return True
+
+    def shed(self) -> bool:
+        if len(self.shedable) == 0:
+            return False
+        item = self.shedable.pop(next(iter(self.shedable)))
+        self.channels[item.channel_id].remove(item)
+        self.size -= 1
+        logger.debug(f"Shedding the oldest non-urgent message in channel_id={item.channel_id}")
+        ingest_dropped.inc(reason="shed", urgent=False)
+        self.drop(item.message, False)
+        return True
+
+    def schedule(self, channel_id: int):
+        self.scheduled.add(channel_id)
+        if self.channels[channel_id][0].urgent:
+            self.urgent_ready.append(channel_id)
+        else:
+            self.ready.append(channel_id)
+        self.ready_count.release()
+
+    def take(self) -> Item | None:
+        channel_id = self.urgent_ready.popleft() if len(self.urgent_ready) > 0 else self.ready.popleft()
+        queue = self.channels.get(channel_id)
+        if not queue:
+            # Everything in this channel was shed while it waited
+            self.channels.pop(channel_id, None)
+            self.scheduled.discard(channel_id)
+            return None
+        item = queue.popleft()
+        self.shedable.pop(item.id, None)
+        self.size -= 1
+        return item
+
+    def finish(self, item: Item):
+        queue = self.channels.get(item.channel_id)
+        if queue:
+            self.schedule(item.channel_id)
+        else:
+            self.channels.pop(item.channel_id, None)
+            self.scheduled.discard(item.channel_id)
+        if self.size == 0 and self.busy == 0:
+            self.idle.set()
+
+    async def work(self):
+        while True:
+            await self.ready_count.acquire()
+            item = self.take()
+            if item is None:
+                continue
+            observe("queue_wait", time.perf_counter() - item.queued_at)
+            self.busy += 1
+            try:
+                await self.handle(item.message)
+            except Exception as err:
+                logger.exception(f"Failed to handle a message in channel_id={item.channel_id}: {err}")
+            finally:
+                self.busy -= 1
+                self.finish(item)
+
+    async def join(self):
+        """
+        Wait until every queued message has been handled.
+        """
+        await self.idle.wait()
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
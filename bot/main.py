@@ -1,78 +1,192 @@
 #!/usr/bin/env python
 
-import re
+import asyncio
 import signal
 import sys
 from contextlib import contextmanager
 from dataclasses import dataclass
 
+from bot import startup
+
 import discord
 import snick
 from loguru import logger
-from discord.utils import find as discord_find
 
+from bot import completions
 from bot.config import settings
-from bot.ai import guess_command, guess_user, get_chat, guess_action
-from bot.constants import Command, BOT_NAME
-from bot.exceptions import StateError
-from bot.state_machine import process_action
-from bot.types import CommandGuess, Game, Action, UserGuess, ActionGuess
+from bot import ai
+from bot.ai import guess_action
+from bot.constants import Command, GameStatus, Poison, ReplyKind, BOT_NAME
+from bot.exceptions import AIError, AIUnavailable, StateError
+from bot.grammar import NEEDS_CHOICE, NEEDS_TARGET, ParseStats, parse_intent
+from bot.ingest import IngestQueue
+from bot import metrics
+from bot.metrics import span
+from bot.members import MemberRegistry
+from bot.output import CHAT_LEVEL, ChatBuffer, chat_sink, current_buffer
+from bot.persistence import GameStore
+from bot.pool import TextPool
+from bot import replies
+from bot.replies import miss_reply, offline_reply, throttled_reply
+from bot.sessions import SessionRegistry
+from bot.shards import owns_guild
+from bot.throttle import Throttle
+from bot.state_machine import process_action, transitions
+from bot.types import Action, ActionGuess, IntentMatch
 
 
 logger.remove()
 logger.add(sys.stderr, level="TRACE")
+logger.add(chat_sink, level=CHAT_LEVEL)
 
 
 
-class MyClient(discord.Client):
-    current_game: Game = Game()
+class MyClient(discord.AutoShardedClient):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.sessions = SessionRegistry(
+            idle_ttl=settings.SESSION_IDLE_TTL,
+            max_sessions=settings.SESSION_MAX_COUNT,
+        )
+        self.store = GameStore(
+            settings.DATA_DIR / "games.sqlite3",
+            flush_interval=settings.PERSIST_FLUSH_INTERVAL,
+            snapshot_every=settings.PERSIST_SNAPSHOT_EVERY,
+        )
+        self.parse_stats = ParseStats()
+        self.metrics_runner = None
+        self.members = MemberRegistry()
+        self.ingest = IngestQueue(
+            max_size=settings.INGEST_MAX_QUEUE,
+            workers=settings.INGEST_WORKERS,
+            handle=self.process_message,
+            drop=self.drop_message,
+            merge=self.merge_messages,
+            coalesce_window=settings.INGEST_COALESCE_WINDOW,
+        )
+        self.throttle = Throttle(
+            user_rate=settings.THROTTLE_USER_RATE,
+            user_burst=settings.THROTTLE_USER_BURST,
+            channel_rate=settings.THROTTLE_CHANNEL_RATE,
+            channel_burst=settings.THROTTLE_CHANNEL_BURST,
+            max_buckets=settings.THROTTLE_MAX_BUCKETS,
+        )
+        self.ordeals = TextPool(
+            settings.DATA_DIR / "ordeals.sqlite3",
+            kinds=[poison.value for poison in Poison],
+            size=settings.ORDEAL_POOL_SIZE,
+            batch=settings.ORDEAL_POOL_BATCH,
+            generate=lambda kind, count: ai.generate_ordeals(kind, count),
+            is_idle=self.is_idle,
+            refill_interval=settings.POOL_REFILL_INTERVAL,
+        )
+        self.replies = TextPool(
+            settings.DATA_DIR / "replies.sqlite3",
+            kinds=[kind.value for kind in ReplyKind],
+            size=settings.REPLY_POOL_SIZE,
+            batch=settings.REPLY_POOL_BATCH,
+            generate=lambda kind, count: ai.generate_replies(kind, count),
+            is_idle=self.is_idle,
+            refill_interval=settings.POOL_REFILL_INTERVAL,
+        )
+        replies.set_pool(self.replies)
+        self.flush_tasks: set[asyncio.Task] = set()
         signal.signal(signal.SIGINT, self.exit_gracefully)
 
 
-    def parse_command(self, action_guess: ActionGuess, command_text: str):
+    def parse_command(self, action_guess: ActionGuess, command_text: str, available: set[Command]) -> IntentMatch:
         logger.debug(f"Attempting to parse command directly from: {command_text}")
-        regex_match = re.match(
-            r"^{bot_name}\s+(?P<command>\w+)(?:\s+<@(?P<target_id>\d+)>)?$".format(
-                bot_name=BOT_NAME,
-            ),
-            command_text,
-        )
-
-        if regex_match is None:
-            logger.debug("Couldn't parse command from input")
-            return
-        command_text = regex_match.group("command").upper()
-        try:
-            action_guess.command = Command(command_text)
-        except Exception as err:
-            logger.debug(f"Regex parsed command invalid: {err}. Falling back to command guessing")
-            action_guess.command = None
-            return
-        target_id_text = regex_match.group("target_id")
-        if target_id_text is None:
-            action_guess.target_id = None
-            return
-        try:
-            action_guess.target_id = int(target_id_text)
-        except Exception as err:
-            logger.debug(f"Regex parsed target_id invalid: {err}. Falling back to command guessing")
+        match = parse_intent(command_text, available)
+        logger.debug(f"Grammar parsed {match=}")
+        action_guess.command = match.command
+        action_guess.target_id = match.target_id
+        action_guess.choice = match.choice
+        return match
+
+    def accept_local(self, action_guess: ActionGuess, match: IntentMatch, reply: str | None) -> bool:
+        """
+        Decide whether a low-confidence local parse is good enough when the AI can't be used.
+
+        If it isn't, the player gets the canned ``reply`` instead, if there is one.
+        """
+        if match.command is None or (match.target_name is not None and action_guess.target_id is None):
+            if reply is not None:
+                logger.info(f"<@{action_guess.player_id}>, {reply}")
+            return False
+        return True
+
+    def classify(self, action_guess: ActionGuess, match: IntentMatch, text: str, available: set[Command]) -> bool:
+        """
+        Try to recognize a command that the grammar missed with the classifier trained on past AI guesses.
+
+        The nearest example is looked for among all of them. If it is chatter or a command that
+        isn't available right now, the AI is asked instead of settling for a weaker match. Only
+        commands whose target and choice the grammar already found are accepted, since the
+        classifier only knows the command. A recognized miss gets a canned reply.
+        """
+        if not settings.CLASSIFIER_ENABLED:
+            return False
+        with span("classify"):
+            (command, similarity) = ai.get_classifier().classify(text)
+        logger.debug(f"Classifier guessed {command=} with {similarity=:.2f}")
+        if command is None or similarity < settings.CLASSIFIER_THRESHOLD:
+            return False
+        if command not in available and command != Command.MISS:
+            return False
+        if command in NEEDS_TARGET and action_guess.target_id is None:
+            return False
+        if command in NEEDS_CHOICE and (match.command != command or match.choice is None):
+            return False
+
+        if command == Command.MISS:
+            logger.info(f"<@{action_guess.player_id}>, {miss_reply()}")
             action_guess.command = None
+        else:
+            action_guess.command = command
+        return True
 
-    @contextmanager
-    def log_chat(self, channel):
-        def _send(message):
-            self.loop.create_task(channel.send(message.record["message"]))
+    async def on_member_join(self, member):
+        self.members.add(member)
 
-        logger.debug("Adding chat logging handler")
-        handler_id = logger.add(_send, level="INFO")
+    async def on_member_update(self, before, after):
+        self.members.add(after)
+
+    async def on_member_remove(self, member):
+        self.members.remove(member)
+
+    async def on_guild_remove(self, guild):
+        self.members.drop(guild.id)
+
+    @contextmanager
+    def buffer_chat(self, channel):
+        buffer = ChatBuffer(channel)
+        token = current_buffer.set(buffer)
         try:
-            yield
+            yield buffer
         finally:
-            logger.remove(handler_id)
-            logger.debug("Removed chat logging handler")
+            current_buffer.reset(token)
+
+    @contextmanager
+    def log_chat(self, channel):
+        """
+        Gather chat output for a channel and send it in the background afterwards.
+
+        Handled messages use ``buffer_chat`` and wait for the flush instead, so that replies in
+        a channel can't overtake each other.
+        """
+        with self.buffer_chat(channel) as buffer:
+            try:
+                yield buffer
+            finally:
+                task = asyncio.create_task(buffer.flush())
+                self.flush_tasks.add(task)
+                task.add_done_callback(self.flush_done)
+
+    def flush_done(self, task: asyncio.Task):
+        self.flush_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).debug("Failed to flush chat output")
 
     def iter_channels(self):
         for channel in self.get_all_channels():
@@ -86,65 +200,230 @@ class MyClient(discord.Client):
 
         self.loop.create_task(self.close())
 
+    def owns_guild(self, guild_id: int) -> bool:
+        if settings.SHARD_IDS is None:
+            return True
+        return owns_guild(guild_id, settings.SHARD_IDS, settings.SHARD_COUNT)
+
+    async def setup_hook(self):
+        self.sessions.restored = await asyncio.to_thread(self.store.load, self.owns_guild)
+        self.store.start()
+        if settings.ORDEAL_POOL_ENABLED:
+            self.ordeals.start()
+        if settings.REPLY_POOL_ENABLED:
+            self.replies.start()
+        self.ingest.start()
+        if settings.METRICS_ENABLED:
+            self.metrics_runner = await metrics.start_server(settings.METRICS_HOST, settings.METRICS_PORT)
+        startup.mark("setup")
+
+    async def close(self):
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await self.ingest.close()
+        await self.store.close()
+        await self.ordeals.close()
+        replies.set_pool(None)
+        await self.replies.close()
+        await asyncio.gather(*self.flush_tasks, return_exceptions=True)
+        await completions.close()
+        ai.close()
+        await super().close()
+
     async def on_ready(self):
         logger.debug(f'Logged on as {self.user}!')
+        if startup.mark("ready"):
+            logger.debug(startup.report())
+        self.members.exclude(self.user.id)
         for channel in self.iter_channels():
             print("channel", channel)
             with self.log_chat(channel):
                 logger.info("Someone spun the ol' bot up. How are y'all?")
 
     async def on_message(self, message):
-        with self.log_chat(message.channel):
-            logger.debug(f'Message from {message.author} in {message.channel}: {message.content}')
-            if self.user not in message.mentions:
-                logger.debug("Skipping message since dog-bot wasn't mentioned")
-                return
+        logger.debug(f'Message from {message.author} in {message.channel}: {message.content}')
+        if self.user not in message.mentions:
+            logger.debug("Skipping message since dog-bot wasn't mentioned")
+            return
 
-            logger.info("At your service!")
+        if message.guild is None:
+            logger.debug("Skipping message since it wasn't sent in a server channel")
+            return
 
-            message.content = message.content.replace(f"<@{self.user.id}>", BOT_NAME)
-            logger.debug(f"Sanitized content: {message.content}")
-            if message.author != self.user:
-                # try to parse exact command to save AI work
-                action_guess = ActionGuess(player_id=message.author.id)
-                self.parse_command(action_guess, message.content)
-                if action_guess.command is None or action_guess.command is Command.MISS:
-                    logger.debug("Couldn't parse command directly. Falling back to guessing")
-                    player_id_map = {m.display_name: m.id for m in message.channel.members if m.display_name != BOT_NAME}
-                    logger.debug(f"Built {player_id_map=}")
-                    guess_action(action_guess, message.content, player_id_map)
-
-                if action_guess.target_id is None:
-                    target = None
-                else:
-                    logger.debug(f"Looking up {action_guess.target_id=}")
-                    target = discord_find(lambda m: m.id == action_guess.target_id, message.channel.members)
-                    logger.debug(f"Selected target with {target.id=}, {target.name=}, {target.display_name=}")
-
-                action = Action(
-                    command=action_guess.command,
-                    player=message.author,
-                    target=target,
-                    game=self.current_game,
-                    choice="FIX ME",
-                )
-                logger.debug(f"Constructed this action from the guess: {action}")
+        if message.author == self.user:
+            return
 
+        message.content = message.content.replace(f"<@{self.user.id}>", BOT_NAME)
+        logger.debug(f"Sanitized content: {message.content}")
+        self.ingest.put(
+            message.channel.id,
+            message,
+            urgent=self.is_urgent(message.content),
+            sender_id=message.author.id,
+        )
 
-                try:
-                    process_action(action)
-                except StateError as err:
-                    await message.channel.send(err.message)
+    def is_urgent(self, text: str) -> bool:
+        """
+        Tell whether a message is a command that the grammar recognizes, as opposed to chatter.
+        """
+        match = parse_intent(text)
+        return match.command is not None and match.confidence >= settings.GRAMMAR_CONFIDENCE_THRESHOLD
+
+    def is_idle(self) -> bool:
+        """
+        Tell whether there's spare capacity for background AI work.
+        """
+        return len(self.ingest) == 0 and self.ingest.busy == 0 and not completions.get_breaker().is_open
+
+    def suggest_ordeal(self, action: Action):
+        if action.game.poison is None:
+            return
+        ordeal = self.ordeals.take(action.game.poison.value)
+        if ordeal is None:
+            logger.debug(f"The {action.game.poison} ordeal pool is empty")
+            return
+        logger.info(f"<@{action.game.prober}>, need inspiration? Try `ordeal {ordeal}`")
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
+    def drop_message(self, message, urgent: bool):
+        if not urgent:
+            return
+        with self.log_chat(message.channel):
+            logger.info(f"<@{message.author.id}>, I'm swamped right now. Try that again in a moment!")
+
+    def merge_messages(self, pending, message):
+        pending.content = f"{pending.content}\n{message.content}"
+
+    async def process_message(self, message):
+        with self.buffer_chat(message.channel) as buffer:
+            try:
+                with span("on_message"):
+                    logger.info("At your service!")
+                    await self.handle_message(message)
+            finally:
+                # Send before the worker moves on to the next message in this channel
+                await buffer.flush()
+
+    async def handle_message(self, message):
+        member_index = self.members.for_guild(message.guild)
+        with self.sessions.use(message.guild.id, message.channel.id, resolve=member_index.get) as session:
+            # try to parse the command locally to save AI work
+            with span("parse"):
+                action_guess = ActionGuess(player_id=message.author.id)
+                available = set(transitions.get(session.game.status, {})) | {Command.STATUS}
+                match = self.parse_command(action_guess, message.content, available)
+                if match.target_name is not None:
+                    name_match = member_index.best(match.target_name)
+                    logger.debug(f"Closest name to {match.target_name} is {name_match}")
+                    if name_match is not None and name_match.score >= settings.NAME_MATCH_THRESHOLD:
+                        action_guess.target_id = name_match.member_id
+                    else:
+                        logger.debug(f"Couldn't find a member named {match.target_name}")
+                        match.confidence = 0.0
+
+            if match.confidence < settings.GRAMMAR_CONFIDENCE_THRESHOLD and self.classify(
+                action_guess, match, message.content, available
+            ):
+                self.parse_stats.classifier_hits += 1
+                metrics.parses.inc(result="classifier")
+                logger.debug(f"Classifier recognized the command as {action_guess.command}")
+            elif match.confidence < settings.GRAMMAR_CONFIDENCE_THRESHOLD and completions.get_breaker().is_open:
+                self.parse_stats.ai_fallbacks += 1
+                metrics.parses.inc(result="offline")
+                logger.debug("AI is unavailable. Settling for the local parse")
+                if not self.accept_local(action_guess, match, offline_reply()):
+                    return
+            elif (
+                match.confidence < settings.GRAMMAR_CONFIDENCE_THRESHOLD
+                and not self.throttle.allow(message.author.id, message.channel.id)
+            ):
+                metrics.parses.inc(result="throttled")
+                logger.debug("Too many AI requests. Settling for the local parse")
+                reply = throttled_reply() if self.throttle.warn(message.author.id) else None
+                if not self.accept_local(action_guess, match, reply):
+                    return
+            elif match.confidence < settings.GRAMMAR_CONFIDENCE_THRESHOLD:
+                self.parse_stats.ai_fallbacks += 1
+                metrics.parses.inc(result="ai")
+                logger.debug("Couldn't parse command confidently. Falling back to guessing")
+                local_guess = action_guess
+                action_guess = ActionGuess(player_id=message.author.id)
+                try:
+                    with span("guess_action"):
+                        await guess_action(
+                            action_guess,
+                            message.content,
+                            member_index,
+                            message.channel.id,
+                            session.game.status,
+                            list(session.game.players),
+                        )
+                except AIUnavailable as err:
+                    logger.debug(f"AI became unavailable: {err}")
+                    action_guess = local_guess
+                    if not self.accept_local(action_guess, match, offline_reply()):
+                        return
+                except AIError as err:
+                    logger.debug(f"AI request failed: {err}")
+                    logger.info(offline_reply())
+                    return
+            else:
+                self.parse_stats.local_hits += 1
+                metrics.parses.inc(result="local")
+            logger.debug(f"Command parsing stats: {self.parse_stats}")
+
+            if action_guess.command is None:
+                return
 
-client = MyClient(intents=intents)
+            if action_guess.target_id is not None:
+                logger.debug(f"Looking up {action_guess.target_id=}")
+                target = member_index.get(action_guess.target_id)
+                if target is None:
+                    logger.info(f"I don't know who <@{action_guess.target_id}> is. Are they in this server?")
+                    return
+                logger.debug(f"Selected target with {target.id=}, {target.name=}, {target.display_name=}")
+
+            action = Action(
+                command=action_guess.command,
+                player_id=message.author.id,
+                target_id=action_guess.target_id,
+                game=session.game,
+                choice=action_guess.choice,
+                resolve=member_index.get,
+            )
+            logger.debug(f"Constructed this action from the guess: {action}")
+
+            async with session.lock:
+                with span("process_action"):
+                    from_status = session.game.status
+                    try:
+                        process_action(action)
+                    except StateError as err:
+                        logger.info(err.message)
+                    else:
+                        self.store.record(session.key, action)
+                        if session.game.status == GameStatus.AWAITING_ORDEAL and from_status != GameStatus.AWAITING_ORDEAL:
+                            self.suggest_ordeal(action)
+
+
+def make_intents() -> discord.Intents:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    return intents
+
+
+def build_client() -> MyClient:
+    return MyClient(intents=make_intents(), shard_ids=settings.SHARD_IDS, shard_count=settings.SHARD_COUNT)
 
 
 def run():
-    client.run(settings.DISCORD_TOKEN)
+    startup.mark("imports")
+    token = settings.DISCORD_TOKEN
+    startup.mark("settings")
+    client = build_client()
+    startup.mark("client")
+    client.run(token)
+
 
 """
 <@{message.author.id}>, I can't start a new game because
@@ -180,5 +459,6 @@ there isn't any going yet!
 <@{message.author.id}> has challenged you, <@{action.target}>! Truth or Dare?!
 """
 
+
 if __name__ == "__main__":
     run()
@@ -0,0 +1,96 @@
+from discord import Guild, Member
+from loguru import logger
+
+from bot.names import NameIndex, normalize_name
+from bot.types import NameMatch
+
+
+class MemberIndex:
+    """
+    Keep the members of one guild indexed by id and by name.
+
+    The index is built once from the guild's member cache and then kept up to date from
+    gateway member events, so lookups never have to scan the member list.
+    """
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.members: dict[int, Member] = {}
+        self.name_ids: dict[str, int] = {}
+        self.names = NameIndex()
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, member_id: int):
+        return member_id in self.members
+
+    def add(self, member: Member):
+        self.remove(member.id)
+        self.members[member.id] = member
+        self.name_ids[normalize_name(member.display_name)] = member.id
+        self.names.add(member.id, member.display_name)
+
+    def remove(self, member_id: int):
+        member = self.members.pop(member_id, None)
+        if member is None:
+            return
+        normalized = normalize_name(member.display_name)
+        if self.name_ids.get(normalized) == member_id:
+            del self.name_ids[normalized]
+        self.names.remove(member_id)
+
+    def get(self, member_id: int) -> Member | None:
+        return self.members.get(member_id)
+
+    def find(self, name: str) -> int | None:
+        return self.name_ids.get(normalize_name(name))
+
+    def best(self, name: str) -> NameMatch | None:
+        member_id = self.find(name)
+        if member_id is not None:
+            return NameMatch(member_id=member_id, name=self.members[member_id].display_name, score=1.0)
+        return self.names.best(name)
+
+
+class MemberRegistry:
+    """
+    Hold a MemberIndex for every guild the bot can see.
+    """
+
+    def __init__(self):
+        self.indexes: dict[int, MemberIndex] = {}
+        self.excluded_ids: set[int] = set()
+
+    def exclude(self, member_id: int):
+        self.excluded_ids.add(member_id)
+        for index in self.indexes.values():
+            index.remove(member_id)
+
+    def for_guild(self, guild: Guild) -> MemberIndex:
+        index = self.indexes.get(guild.id)
+        if index is None:
+            index = self.build(guild)
+        return index
+
+    def build(self, guild: Guild) -> MemberIndex:
+        logger.debug(f"Building member index for guild {guild}")
+        index = MemberIndex(guild.id)
+        for member in guild.members:
+            if member.id not in self.excluded_ids:
+                index.add(member)
+        self.indexes[guild.id] = index
+        return index
+
+    def drop(self, guild_id: int):
+        self.indexes.pop(guild_id, None)
+
+    def add(self, member: Member):
+        index = self.indexes.get(member.guild.id)
+        if index is not None and member.id not in self.excluded_ids:
+            index.add(member)
+
+    def remove(self, member: Member):
+        index = self.indexes.get(member.guild.id)
+        if index is not None:
+            index.remove(member.id)
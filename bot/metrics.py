@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+
+# Only the most recent samples of each stage are kept for computing percentiles
+MAX_SAMPLES = 10000
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for (name, value) in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: dict[str, str] | None = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if len(pairs) == 0:
+        return ""
+    text = ",".join(f'{name}="{value}"' for (name, value) in pairs)
+    return f"{{{text}}}"
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values: defaultdict[LabelKey, float] = defaultdict(float)
+        registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        self.values[_label_key(labels)] += amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for (key, value) in self.values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+    def reset(self):
+        self.values.clear()
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.counts: dict[LabelKey, list[int]] = {}
+        self.sums: defaultdict[LabelKey, float] = defaultdict(float)
+        registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+            self.counts[key] = counts
+        for (i, bound) in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[key] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for (key, counts) in self.counts.items():
+            cumulative = 0
+            for (bound, count) in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, dict(le=str(bound)))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(key, dict(le='+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {self.sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+    def reset(self):
+        self.counts.clear()
+        self.sums.clear()
+
+
+registry: list[Counter | Histogram] = []
+
+stage_seconds = Histogram("dogbot_stage_seconds", "Time spent in each stage of handling a message")
+ai_requests = Counter("dogbot_ai_requests_total", "AI requests by stage and outcome")
+ai_retries = Counter("dogbot_ai_retries_total", "AI requests that were retried after a transient failure")
+ai_breaker_trips = Counter("dogbot_ai_breaker_trips_total", "Times the AI circuit breaker opened")
+ai_tokens = Counter("dogbot_ai_tokens_total", "AI tokens used by stage and kind")
+cache_lookups = Counter("dogbot_cache_lookups_total", "Guess cache lookups by kind and result")
+parses = Counter("dogbot_parses_total", "Messages resolved by the local grammar or by the AI")
+transitions = Counter("dogbot_transitions_total", "Game state transitions by command and status")
+ingest_dropped = Counter("dogbot_ingest_dropped_total", "Messages dropped by the ingest queue by reason and urgency")
+ingest_coalesced = Counter("dogbot_ingest_coalesced_total", "Messages merged into an earlier queued message from the same sender")
+send_retries = Counter("dogbot_send_retries_total", "Discord sends that were retried after an error")
+send_failures = Counter("dogbot_send_failures_total", "Discord sends that failed after all retries")
+
+stage_samples: defaultdict[str, deque[float]] = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+
+
+def observe(stage: str, elapsed: float):
+    stage_seconds.observe(elapsed, stage=stage)
+    stage_samples[stage].append(elapsed)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time the enclosed block and record the duration in seconds under ``stage``.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if len(samples) == 0:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize() -> dict[str, dict[str, float]]:
+    summary = {}
+    for (stage, samples) in stage_samples.items():
+        samples = list(samples)
+        summary[stage] = dict(
+            count=len(samples),
+            mean=sum(samples) / len(samples) if len(samples) > 0 else 0.0,
+            p50=percentile(samples, 0.50),
+            p95=percentile(samples, 0.95),
+            p99=percentile(samples, 0.99),
+        )
+    return summary
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    stage_samples.clear()
+    for metric in registry:
+        metric.reset()
+
+
+async def handle_metrics(_request: web.Request) -> web.Response:
+    from aiohttp import web
+
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """
+    Serve the metrics in the Prometheus text format at ``/metrics``.
+    """
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.debug(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,122 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from bot.types import NameMatch
+
+
+# Only the candidates that share the most trigrams with a query are reranked by edit distance
+RERANK_CANDIDATES = 25
+
+
+def normalize_name(name: str) -> str:
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = re.sub(r"[^\w\s]", "", name.casefold())
+    return " ".join(name.split())
+
+
+def trigrams(name: str) -> set[str]:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(left: str, right: str) -> int:
+    if len(left) < len(right):
+        (left, right) = (right, left)
+    previous = list(range(len(right) + 1))
+    for (i, left_char) in enumerate(left, start=1):
+        current = [i]
+        for (j, right_char) in enumerate(right, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (left_char != right_char),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+class NameIndex:
+    """
+    Match loosely typed names against the display names of a set of members.
+
+    Names are indexed by their character trigrams. A query first collects the members that
+    share the most trigrams with it, and then reranks those few by edit distance. Members can
+    be added, renamed, and removed without rebuilding the index.
+    """
+
+    def __init__(self):
+        self.names: dict[int, str] = {}
+        self.normalized: dict[int, str] = {}
+        self.postings: defaultdict[str, set[int]] = defaultdict(set)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, member_id: int):
+        return member_id in self.names
+
+    def add(self, member_id: int, name: str):
+        if member_id in self.names:
+            if self.names[member_id] == name:
+                return
+            self.remove(member_id)
+
+        normalized = normalize_name(name)
+        self.names[member_id] = name
+        self.normalized[member_id] = normalized
+        for gram in trigrams(normalized):
+            self.postings[gram].add(member_id)
+
+    def remove(self, member_id: int):
+        name = self.names.pop(member_id, None)
+        if name is None:
+            return
+
+        normalized = self.normalized.pop(member_id)
+        for gram in trigrams(normalized):
+            posting = self.postings[gram]
+            posting.discard(member_id)
+            if len(posting) == 0:
+                del self.postings[gram]
+
+    def score(self, query: str, query_grams: set[str], member_id: int) -> float:
+        candidate = self.normalized[member_id]
+        if candidate == query:
+            return 1.0
+
+        candidate_grams = trigrams(candidate)
+        dice = 2 * len(query_grams & candidate_grams) / (len(query_grams) + len(candidate_grams))
+        similarity = 1 - edit_distance(query, candidate) / max(len(query), len(candidate))
+        score = (dice + similarity) / 2
+
+        # People often type just the start or a piece of a long display name
+        if candidate.startswith(query) or any(word.startswith(query) for word in candidate.split()):
+            score = max(score, 0.7 + 0.3 * len(query) / len(candidate))
+        elif query in candidate:
+            score = max(score, 0.6 + 0.3 * len(query) / len(candidate))
+        return min(score, 0.99)
+
+    def search(self, name: str, limit: int = 5) -> list[NameMatch]:
+        query = normalize_name(name)
+        if len(query) == 0:
+            return []
+
+        query_grams = trigrams(query)
+        shared: Counter[int] = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+
+        matches = [
+            NameMatch(member_id=member_id, name=self.names[member_id], score=self.score(query, query_grams, member_id))
+            for (member_id, _) in shared.most_common(RERANK_CANDIDATES)
+        ]
+        matches.sort(key=lambda m: m.score, reverse=True)
+        return matches[:limit]
+
+    def best(self, name: str) -> NameMatch | None:
+        matches = self.search(name, limit=1)
+        return matches[0] if len(matches) > 0 else None
@@ -0,0 +1,127 @@
+import asyncio
+from contextvars import ContextVar
+from typing import AsyncIterator
+
+import discord
+from loguru import logger
+
+from bot.constants import DISCORD_MESSAGE_LIMIT, SEND_ATTEMPTS, STREAM_PLACEHOLDER
+from bot.metrics import send_failures, send_retries, span
+
+
+def split_message(lines: list[str], limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """
+    Pack lines into as few messages as possible without going over the length limit.
+
+    Lines are only broken up if a single line is longer than the limit by itself.
+    """
+    chunks = []
+    current = ""
+    for line in lines:
+        while len(line) > limit:
+            if current != "":
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+
+        if current == "":
+            current = line
+        elif len(current) + 1 + len(line) <= limit:
+            current = f"{current}\n{line}"
+        else:
+            chunks.append(current)
+            current = line
+
+    if current != "":
+        chunks.append(current)
+    return chunks
+
+
+class ChatBuffer:
+    """
+    Gather the chat output for one handled message so that it can be sent all at once.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.lines: list[str] = []
+
+    def write(self, message):
+        self.lines.append(message.record["message"])
+
+    async def flush(self):
+        if len(self.lines) == 0:
+            return
+        chunks = split_message(self.lines)
+        self.lines = []
+        logger.debug(f"Sending {len(chunks)} message(s) to {self.channel}")
+        with span("send"):
+            for chunk in chunks:
+                await self.send(chunk)
+
+    async def send(self, content: str):
+        for attempt in range(1, SEND_ATTEMPTS + 1):
+            try:
+                return await self.channel.send(content)
+            except discord.HTTPException as err:
+                if attempt == SEND_ATTEMPTS or err.status < 500:
+                    send_failures.inc()
+                    logger.debug(f"Couldn't send a message to {self.channel}: {err}")
+                    return None
+                send_retries.inc()
+                logger.debug(f"Retrying send to {self.channel} after {err}")
+                await asyncio.sleep(0.5 * attempt)
+
+    async def stream(self, prefix: str, deltas: AsyncIterator[str], edit_interval: float) -> str:
+        """
+        Post a placeholder right away and edit it as text arrives, at most once per ``edit_interval``.
+
+        Anything already in the buffer is sent first so that the output stays in order. The full
+        text is returned once the stream ends.
+        """
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        posted = await self.send(f"{prefix}{STREAM_PLACEHOLDER}")
+        text = ""
+        shown = ""
+        last_edit = loop.time()
+
+        async def _edit(content: str):
+            nonlocal shown, last_edit
+            content = content[:DISCORD_MESSAGE_LIMIT]
+            last_edit = loop.time()
+            if posted is None or content == shown:
+                return
+            shown = content
+            try:
+                await posted.edit(content=content)
+            except discord.HTTPException as err:
+                logger.debug(f"Couldn't edit streamed message in {self.channel}: {err}")
+
+        async for delta in deltas:
+            text += delta
+            if loop.time() - last_edit >= edit_interval:
+                await _edit(f"{prefix}{text}{STREAM_PLACEHOLDER}")
+        with span("send"):
+            await _edit(f"{prefix}{text}")
+        return text
+
+
+# Game output is logged at this level. Anything louder is meant for whoever runs the bot
+CHAT_LEVEL = "INFO"
+
+current_buffer: ContextVar[ChatBuffer | None] = ContextVar("current_buffer", default=None)
+
+
+def chat_sink(message):
+    """
+    Route a log record to the chat buffer bound in the current context, if there is one.
+
+    This sink is installed once. Each handled message binds its own buffer, so concurrent
+    handlers in different channels never see each other's output. Warnings and errors are
+    dropped, since tasks started inside a handler inherit its buffer along with its context.
+    """
+    buffer = current_buffer.get()
+    if buffer is not None and message.record["level"].name == CHAT_LEVEL:
+        buffer.write(message)
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from discord import Member
+from loguru import logger
+
+from bot.constants import GameStatus, Poison
+from bot.types import Action, Game, SessionKey
+
+
+def dump_game(game: Game) -> dict[str, Any]:
+    return dict(
+        players=list(game.players),
+        prober=game.prober,
+        victim=game.victim,
+        poison=None if game.poison is None else game.poison.value,
+        ordeal=game.ordeal,
+        status=game.status.value,
+    )
+
+
+def load_game(state: dict[str, Any], resolve: Callable[[int], Member | None]) -> Game:
+    """
+    Rebuild a game from its dumped state, checking its players with ``resolve``.
+
+    Players that can no longer be resolved, for example because they left the server, are
+    dropped from the game.
+    """
+    def _known(member_id: int | None) -> int | None:
+        return None if member_id is None or resolve(member_id) is None else member_id
+
+    return Game(
+        players=dict.fromkeys(i for i in state["players"] if resolve(i) is not None),
+        prober=_known(state["prober"]),
+        victim=_known(state["victim"]),
+        poison=None if state["poison"] is None else Poison(state["poison"]),
+        ordeal=state["ordeal"],
+        status=GameStatus(state["status"]),
+    )
+
+
+def is_empty(state: dict[str, Any]) -> bool:
+    return state["status"] == GameStatus.IDLE.value and len(state["players"]) == 0
+
+
+class GameStore:
+    """
+    Persist games as an append-only log of applied actions plus periodic snapshots.
+
+    Every logged action carries the state of its game after the action was applied. Recovery
+    loads the latest snapshot of each game and then replays the tail of the log on top of it.
+    Actions are buffered in memory and written in batches from a worker thread, so recording an
+    action never blocks the event loop. Once enough actions pile up, the log is compacted into
+    the snapshot table.
+    """
+
+    def __init__(self, path: Path, flush_interval: float, snapshot_every: int):
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.pending: list[tuple] = []
+        self.logged_since_snapshot = 0
+        self.flusher: asyncio.Task | None = None
+        self.db_lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS actions (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                command TEXT NOT NULL,
+                player_id INTEGER NOT NULL,
+                target_id INTEGER,
+                choice TEXT,
+                state TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                PRIMARY KEY (guild_id, channel_id)
+            );
+            """
+        )
+
+    def load(self, owns: Callable[[int], bool] = lambda _: True) -> dict[SessionKey, dict[str, Any]]:
+        """
+        Recover the latest state of every game that isn't empty in a guild that ``owns`` accepts.
+        """
+        start = time.perf_counter()
+        states: dict[SessionKey, dict[str, Any]] = {}
+        with self.db_lock:
+            # Read both tables from one snapshot of the database, so that another worker
+            # compacting the log in between can't make us miss or go back on actions
+            self.db.execute("BEGIN")
+            try:
+                snapshots = self.db.execute("SELECT guild_id, channel_id, state FROM snapshots").fetchall()
+                actions = self.db.execute("SELECT guild_id, channel_id, state FROM actions ORDER BY seq").fetchall()
+            finally:
+                self.db.execute("COMMIT")
+
+        for (guild_id, channel_id, state) in snapshots:
+            states[(guild_id, channel_id)] = json.loads(state)
+
+        replayed = 0
+        for (guild_id, channel_id, state) in actions:
+            states[(guild_id, channel_id)] = json.loads(state)
+            replayed += 1
+
+        self.logged_since_snapshot = replayed
+        states = {key: state for (key, state) in states.items() if owns(key[0]) and not is_empty(state)}
+        logger.debug(
+            f"Restored {len(states)} games after replaying {replayed} actions "
+            f"in {time.perf_counter() - start:.3f} seconds"
+        )
+        return states
+
+    def record(self, key: SessionKey, action: Action):
+        (guild_id, channel_id) = key
+        choice = action.choice
+        if isinstance(choice, Poison):
+            choice = choice.value
+        self.pending.append(
+            (
+                guild_id,
+                channel_id,
+                action.command.value,
+                action.player_id,
+                action.target_id,
+                choice,
+                json.dumps(dump_game(action.game)),
+                time.time(),
+            )
+        )
+
+    def write(self, batch: list[tuple]):
+        with self.db_lock, self.db:
+            self.db.executemany(
+                """
+                INSERT INTO actions (guild_id, channel_id, command, player_id, target_id, choice, state, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                batch,
+            )
+
+    def compact(self):
+        """
+        Fold the action log into one snapshot per game and truncate it.
+        """
+        with self.db_lock, self.db:
+            (last_seq,) = self.db.execute("SELECT MAX(seq) FROM actions").fetchone()
+            if last_seq is None:
+                return
+            self.db.execute(
+                """
+                INSERT OR REPLACE INTO snapshots (guild_id, channel_id, seq, state)
+                SELECT guild_id, channel_id, MAX(seq), state FROM actions
+                WHERE seq <= ?
+                GROUP BY guild_id, channel_id
+                """,
+                (last_seq,),
+            )
+            self.db.execute("DELETE FROM actions WHERE seq <= ?", (last_seq,))
+            self.db.execute(
+                """
+                DELETE FROM snapshots
+                WHERE json_extract(state, '$.status') = ? AND json_array_length(state, '$.players') = 0
+                """,
+                (GameStatus.IDLE.value,),
+            )
+        logger.debug(f"Compacted game log through {last_seq=}")
+
+    async def flush(self):
+        if len(self.pending) == 0:
+            return
+        (batch, self.pending) = (self.pending, [])
+        try:
+            await asyncio.to_thread(self.write, batch)
+        except Exception:
+            self.pending = batch + self.pending
+            raise
+        self.logged_since_snapshot += len(batch)
+        if self.logged_since_snapshot >= self.snapshot_every:
+            self.logged_since_snapshot = 0
+            await asyncio.to_thread(self.compact)
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as err:
+                logger.error(f"Failed to persist games: {err}")
+
+    def start(self):
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.run_flusher())
+
+    async def close(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        await self.flush()
+        with self.db_lock:
+            self.db.close()
@@ -0,0 +1,171 @@
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from bot.cache import normalize
+from bot.exceptions import AIError
+
+
+class TextPool:
+    """
+    Keep a bounded pool of pre-generated texts of each kind, ready to be served instantly.
+
+    A background task tops up any kind that is at least ``batch`` entries short of ``size``
+    by asking ``generate`` for a whole batch at once, but only while ``is_idle`` says the bot
+    has nothing better to do. Texts are deduplicated by their normalized form against both the
+    pool and the last ``size * 4`` texts served of that kind. Every text is written through to
+    SQLite, so a restart keeps the pool and the memory of what was already served.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        kinds: list[str],
+        size: int,
+        batch: int,
+        generate: Callable[[str, int], Awaitable[list[str]]],
+        is_idle: Callable[[], bool],
+        refill_interval: float,
+    ):
+        self.kinds = kinds
+        self.size = size
+        self.batch = batch
+        self.max_served = size * 4
+        self.generate = generate
+        self.is_idle = is_idle
+        self.refill_interval = refill_interval
+        self.entries: dict[str, deque[tuple[str, str]]] = {kind: deque() for kind in kinds}
+        self.keys: dict[str, set[str]] = {kind: set() for kind in kinds}
+        self.served: dict[str, OrderedDict[str, None]] = {kind: OrderedDict() for kind in kinds}
+        self.task: asyncio.Task | None = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pool (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                served_at REAL,
+                PRIMARY KEY (kind, key)
+            )
+            """
+        )
+        self.load()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    def load(self):
+        rows = self.db.execute("SELECT kind, key, text, served_at FROM pool ORDER BY created_at").fetchall()
+        stale = []
+        for (kind, key, text, served_at) in rows:
+            if kind not in self.entries:
+                continue
+            if served_at is None and len(self.entries[kind]) < self.size:
+                self.entries[kind].append((key, text))
+                self.keys[kind].add(key)
+            elif served_at is not None:
+                self.served[kind][key] = None
+            else:
+                stale.append((kind, key))
+        for kind in self.kinds:
+            stale.extend((kind, key) for key in self.forget_served(kind))
+        with self.db:
+            self.db.executemany("DELETE FROM pool WHERE kind = ? AND key = ?", stale)
+        logger.debug(f"Loaded {len(self)} pooled texts for {', '.join(self.kinds)}")
+
+    def forget_served(self, kind: str) -> list[str]:
+        forgotten = []
+        served = self.served[kind]
+        while len(served) > self.max_served:
+            (key, _) = served.popitem(last=False)
+            forgotten.append(key)
+        return forgotten
+
+    def take(self, kind: str) -> str | None:
+        """
+        Serve the oldest pooled text of a kind, or None if the pool has run dry.
+        """
+        entries = self.entries.get(kind)
+        if not entries:
+            return None
+        (key, text) = entries.popleft()
+        self.keys[kind].discard(key)
+        self.served[kind][key] = None
+        forgotten = self.forget_served(kind)
+        with self.db:
+            self.db.execute("UPDATE pool SET served_at = ? WHERE kind = ? AND key = ?", (time.time(), kind, key))
+            self.db.executemany("DELETE FROM pool WHERE kind = ? AND key = ?", [(kind, k) for k in forgotten])
+        return text
+
+    def add(self, kind: str, texts: list[str]) -> int:
+        now = time.time()
+        rows = []
+        for text in texts:
+            text = text.strip()
+            key = normalize(text)
+            if key == "" or key in self.keys[kind] or key in self.served[kind]:
+                continue
+            if len(self.entries[kind]) >= self.size:
+                break
+            self.entries[kind].append((key, text))
+            self.keys[kind].add(key)
+            rows.append((kind, key, text, now))
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO pool (kind, key, text, created_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def shortest(self) -> str | None:
+        kind = min(self.kinds, key=lambda k: len(self.entries[k]))
+        if self.size - len(self.entries[kind]) < self.batch:
+            return None
+        return kind
+
+    async def refill(self) -> bool:
+        """
+        Generate one batch for the kind that is furthest below its size, if any is short.
+        """
+        kind = self.shortest()
+        if kind is None:
+            return False
+        try:
+            texts = await self.generate(kind, self.batch)
+        except AIError as err:
+            logger.debug(f"Couldn't generate texts for the {kind} pool: {err}")
+            return False
+        added = self.add(kind, texts)
+        logger.debug(f"Added {added} of {len(texts)} generated texts to the {kind} pool")
+        return added > 0
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.refill_interval)
+            try:
+                # Keep refilling back to back while there's nothing else to do
+                while self.is_idle() and await self.refill():
+                    pass
+            except Exception as err:
+                logger.exception(f"Failed to refill the pool: {err}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+        self.db.close()
@@ -0,0 +1,208 @@
+"""
+Reload parts of the bot inside the running process when their source changes.
+
+Only the modules in ``RELOAD_ORDER`` are reloaded. They hold the game rules, prompts and
+constants but none of the connection state, so the gateway connection and every live session
+survive a reload. A change to any other module, ``bot.main`` included, needs a full restart.
+"""
+
+import asyncio
+import enum
+import importlib
+import os
+import sys
+from dataclasses import fields
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from loguru import logger
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+
+# Modules that can be swapped in place, in the order they must be reloaded
+RELOAD_ORDER = ["bot.constants", "bot.grammar", "bot.state_machine", "bot.ai"]
+
+# Every other reloadable module imports names from these, so they pull the rest along
+CASCADE = {"bot.constants"}
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def module_name(path: str) -> str | None:
+    path = Path(path).resolve()
+    if path.suffix != ".py" or path.parent != PACKAGE_DIR:
+        return None
+    return f"bot.{path.stem}"
+
+
+def plan(changed: set[str]) -> list[str] | None:
+    """
+    Pick the modules to reload for a set of changed modules, or None if a restart is needed.
+    """
+    if any(name not in RELOAD_ORDER for name in changed):
+        return None
+    if changed & CASCADE:
+        return list(RELOAD_ORDER)
+    return [name for name in RELOAD_ORDER if name in changed]
+
+
+def rebind(old_state: dict[str, Any], module: ModuleType, skip: set[str]):
+    """
+    Point names that other bot modules imported from the old module at their new versions.
+    """
+    by_name = {}
+    by_identity = {}
+    for (name, old) in old_state.items():
+        new = module.__dict__.get(name)
+        if new is None or new is old or name.startswith("__"):
+            continue
+        by_name[name] = (old, new)
+        # Functions and classes may also have been imported under another name
+        if getattr(old, "__module__", None) == module.__name__:
+            by_identity[id(old)] = new
+
+    for (name, other) in list(sys.modules.items()):
+        if other is None or name in skip or not (name == "bot" or name.startswith("bot.")):
+            continue
+        for (attr, value) in list(vars(other).items()):
+            (old, new) = by_name.get(attr, (None, None))
+            if old is not None and value is old:
+                setattr(other, attr, new)
+            elif id(value) in by_identity:
+                setattr(other, attr, by_identity[id(value)])
+
+
+def remap_enums(obj: Any, constants: ModuleType):
+    """
+    Swap enum members on a dataclass instance for the matching members of the reloaded enums.
+    """
+    for field in fields(obj):
+        value = getattr(obj, field.name)
+        if not isinstance(value, enum.Enum) or type(value).__module__ != constants.__name__:
+            continue
+        new_cls = getattr(constants, type(value).__name__, None)
+        if new_cls is not None and type(value) is not new_cls:
+            setattr(obj, field.name, new_cls(value.value))
+
+
+class ChangeHandler(FileSystemEventHandler):
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, notify):
+        super().__init__()
+        self.loop = loop
+        self.notify = notify
+
+    def trigger(self, event):
+        path = getattr(event, "dest_path", None) or event.src_path
+        name = module_name(path)
+        if name is not None:
+            self.loop.call_soon_threadsafe(self.notify, name)
+
+    def on_created(self, event):
+        self.trigger(event)
+
+    def on_modified(self, event):
+        self.trigger(event)
+
+    def on_moved(self, event):
+        self.trigger(event)
+
+
+class Reloader:
+    """
+    Watch the bot package and apply changes to a running client.
+
+    File events arrive from the watchdog thread and are collected on the event loop until
+    nothing has changed for ``debounce`` seconds, so that an editor saving several files, or
+    saving one file in several writes, causes a single reload.
+    """
+
+    def __init__(self, client, debounce: float):
+        self.client = client
+        self.debounce = debounce
+        self.pending: set[str] = set()
+        self.timer: asyncio.TimerHandle | None = None
+        self.lock = asyncio.Lock()
+        self.observer: Observer | None = None
+        self.tasks: set[asyncio.Task] = set()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self.observer = Observer()
+        self.observer.schedule(ChangeHandler(loop, self.notify), str(PACKAGE_DIR), recursive=False)
+        self.observer.start()
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        self.observer = None
+
+    def notify(self, name: str):
+        self.pending.add(name)
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = asyncio.get_running_loop().call_later(self.debounce, self.flush)
+
+    def flush(self):
+        self.timer = None
+        (changed, self.pending) = (self.pending, set())
+        task = asyncio.create_task(self.apply(changed))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def apply(self, changed: set[str]):
+        async with self.lock:
+            names = plan(changed)
+            if names is None:
+                await self.restart(changed)
+                return
+            for name in names:
+                if not self.reload(name):
+                    logger.debug(f"Stopped reloading after {name} failed")
+                    return
+            if "bot.constants" in names:
+                self.remap_sessions()
+            logger.debug(f"Reloaded {', '.join(names)}")
+
+    def reload(self, name: str) -> bool:
+        module = sys.modules.get(name)
+        if module is None:
+            # Nothing has imported it yet, so the next import will pick up the new source
+            return True
+
+        try:
+            compile(Path(module.__file__).read_text(), module.__file__, "exec")
+        except SyntaxError as err:
+            logger.error(f"Not reloading {name}: {err}")
+            return False
+
+        old_state = dict(module.__dict__)
+        try:
+            importlib.reload(module)
+            hook = module.__dict__.get("__reload__")
+            if hook is not None:
+                hook(old_state)
+        except Exception as err:
+            logger.exception(f"Failed to reload {name}: {err}")
+            module.__dict__.clear()
+            module.__dict__.update(old_state)
+            return False
+
+        rebind(old_state, module, skip={name})
+        return True
+
+    def remap_sessions(self):
+        constants = sys.modules["bot.constants"]
+        for session in self.client.sessions.sessions.values():
+            remap_enums(session.game, constants)
+
+    async def restart(self, changed: set[str]):
+        logger.debug(f"Restarting because {', '.join(sorted(changed))} can't be reloaded in place")
+        self.stop()
+        await self.client.close()
+        os.execv(sys.executable, [sys.executable, "-m", "bot.watcher", *sys.argv[1:]])
@@ -0,0 +1,199 @@
+"""
+A local stand-in for the OpenAI chat completions endpoint that records and replays exchanges.
+
+In ``record`` mode every request is forwarded to OpenAI and the exchange is appended to a
+fixture file. In ``replay`` mode requests are answered from the fixture file without any
+network access. Streaming requests are recorded chunk by chunk and replayed as server-sent
+events. Either way, latency, errors, and timeouts can be injected. Point the bot at it with
+``OPENAI_API_BASE``::
+
+    poetry run replay --mode record --fixtures fixtures/ai.jsonl
+    OPENAI_API_BASE=http://127.0.0.1:8089/v1 poetry run bot
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from collections import defaultdict
+from pathlib import Path
+
+from aiohttp import ClientSession, ClientTimeout, web
+from loguru import logger
+
+
+UPSTREAM_API_BASE = "https://api.openai.com/v1"
+
+
+def request_key(body: dict) -> str:
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def error_body(message: str, kind: str) -> dict:
+    return dict(error=dict(message=message, type=kind, param=None, code=None))
+
+
+class Fixtures:
+    """
+    Hold recorded exchanges keyed by a hash of the request body.
+
+    A request that was recorded several times is answered with each recorded response in turn.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.responses: defaultdict[str, list[dict]] = defaultdict(list)
+        self.cursors: defaultdict[str, int] = defaultdict(int)
+        if path.exists():
+            with path.open() as file:
+                for line in file:
+                    if line.strip() != "":
+                        exchange = json.loads(line)
+                        self.responses[exchange["key"]].append(exchange["response"])
+        logger.info(f"Loaded {sum(len(r) for r in self.responses.values())} recorded exchanges from {path}")
+
+    def find(self, key: str) -> dict | None:
+        responses = self.responses.get(key)
+        if not responses:
+            return None
+        cursor = self.cursors[key]
+        self.cursors[key] = cursor + 1
+        return responses[cursor % len(responses)]
+
+    def add(self, key: str, request: dict, response: dict):
+        self.responses[key].append(response)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as file:
+            file.write(json.dumps(dict(key=key, request=request, response=response)) + "\n")
+
+
+class StandIn:
+    def __init__(self, args):
+        self.args = args
+        self.fixtures = Fixtures(Path(args.fixtures))
+        self.random = random.Random(args.seed)
+        self.session: ClientSession | None = None
+
+    async def inject_faults(self) -> web.Response | None:
+        delay = max(0.0, self.random.gauss(self.args.latency, self.args.jitter))
+        await asyncio.sleep(delay)
+
+        roll = self.random.random()
+        if roll < self.args.timeout_rate:
+            logger.debug("Injecting a timeout")
+            await asyncio.sleep(self.args.timeout_delay)
+            return web.json_response(error_body("Injected timeout", "timeout"), status=504)
+        if roll < self.args.timeout_rate + self.args.error_rate:
+            logger.debug("Injecting an error")
+            status = self.random.choice([429, 500, 503])
+            return web.json_response(error_body(f"Injected {status} error", "server_error"), status=status)
+        return None
+
+    def post_upstream(self, request: web.Request, body: dict):
+        if self.session is None:
+            self.session = ClientSession(timeout=ClientTimeout(total=self.args.upstream_timeout))
+        headers = {"Authorization": request.headers.get("Authorization", "")}
+        return self.session.post(f"{self.args.upstream}/chat/completions", json=body, headers=headers)
+
+    async def forward(self, request: web.Request, body: dict) -> tuple[int, dict]:
+        async with self.post_upstream(request, body) as response:
+            return (response.status, await response.json())
+
+    async def open_stream(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        return response
+
+    async def end_stream(self, response: web.StreamResponse):
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+
+    async def replay_stream(self, request: web.Request, chunks: list[dict]) -> web.StreamResponse:
+        response = await self.open_stream(request)
+        for chunk in chunks:
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await self.end_stream(response)
+        return response
+
+    async def record_stream(self, request: web.Request, body: dict, key: str) -> web.StreamResponse:
+        async with self.post_upstream(request, body) as upstream:
+            if upstream.status != 200:
+                return web.json_response(await upstream.json(), status=upstream.status)
+
+            response = await self.open_stream(request)
+            chunks = []
+            async for line in upstream.content:
+                data = line.decode("utf-8").strip()
+                if not data.startswith("data:"):
+                    continue
+                data = data[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunks.append(json.loads(data))
+                await response.write(f"data: {data}\n\n".encode("utf-8"))
+            await self.end_stream(response)
+
+        self.fixtures.add(key, body, dict(chunks=chunks))
+        logger.debug(f"Recorded streamed exchange {key[:12]}")
+        return response
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        key = request_key(body)
+
+        fault = await self.inject_faults()
+        if fault is not None:
+            return fault
+
+        response_body = self.fixtures.find(key) if self.args.mode == "replay" else None
+        if response_body is None and self.args.mode == "replay":
+            logger.warning(f"No recorded exchange for request {key[:12]}")
+            return web.json_response(error_body(f"No recorded exchange for request {key}", "invalid_request_error"), status=404)
+
+        if body.get("stream"):
+            if response_body is not None:
+                return await self.replay_stream(request, response_body["chunks"])
+            return await self.record_stream(request, body, key)
+
+        if response_body is None:
+            (status, response_body) = await self.forward(request, body)
+            if status != 200:
+                return web.json_response(response_body, status=status)
+            self.fixtures.add(key, body, response_body)
+            logger.debug(f"Recorded exchange {key[:12]}")
+
+        return web.json_response(response_body)
+
+    async def close(self, _app):
+        if self.session is not None:
+            await self.session.close()
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Record and replay OpenAI chat completions locally")
+    parser.add_argument("--mode", choices=["record", "replay"], default="replay")
+    parser.add_argument("--fixtures", default="fixtures/ai.jsonl")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--upstream", default=UPSTREAM_API_BASE)
+    parser.add_argument("--upstream-timeout", type=float, default=60.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean added latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the added latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--timeout-delay", type=float, default=120.0, help="How long a hanging request hangs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stand_in = StandIn(args)
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stand_in.chat_completions)
+    app.on_cleanup.append(stand_in.close)
+    logger.info(f"Serving {args.mode} stand-in on http://{args.host}:{args.port}/v1")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    run()
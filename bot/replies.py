@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from random import choice
+from typing import TYPE_CHECKING
+
+from bot.constants import ReplyKind
+
+if TYPE_CHECKING:
+    from bot.pool import TextPool
+
+
+offline_replies = [
+    "My brain is running slow right now. Try an exact command like `join`, `status`, or `users`!",
+    "I'm too busy chasing my tail to think. Use a plain command like `join` or `status` for now.",
+    "Ruff day. I can only follow simple commands right now, like `start`, `join`, or `leave`.",
+    "My thinking cap fell off. Say `status` to see which commands I can still handle.",
+]
+
+miss_replies = [
+    "I have no idea what that means, and I'm a dog. Say `status` to see what you can do.",
+    "That's not a command, genius. Try `status` if you don't know how to play.",
+    "Nice try, but I only speak truth or dare. Say `status` to see the commands.",
+]
+
+throttled_replies = [
+    "Whoa there, slow down! I can only think so fast. Plain commands like `join` still work.",
+    "You're talking faster than I can fetch. Give me a second, or use an exact command.",
+    "Easy, I'm just a dog. Wait a moment before asking me anything fancy again.",
+]
+
+
+# Pre-generated replies served ahead of the canned ones, set up by the client
+pool: TextPool | None = None
+
+
+def set_pool(new_pool: TextPool | None):
+    global pool
+    pool = new_pool
+
+
+def pooled_reply(kind: ReplyKind, canned: list[str]) -> str:
+    if pool is not None:
+        reply = pool.take(kind.value)
+        if reply is not None:
+            return reply
+    return choice(canned)
+
+
+def offline_reply() -> str:
+    return choice(offline_replies)
+
+
+def miss_reply() -> str:
+    return pooled_reply(ReplyKind.MISS, miss_replies)
+
+
+def throttled_reply() -> str:
+    return pooled_reply(ReplyKind.THROTTLED, throttled_replies)
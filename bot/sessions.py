@@ -0,0 +1,94 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from discord import Member
+from loguru import logger
+
+from bot.persistence import dump_game, is_empty, load_game
+from bot.types import Game, SessionKey
+
+
+@dataclass
+class Session:
+    key: SessionKey
+    game: Game = field(default_factory=Game)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+    users: int = 0
+
+
+class SessionRegistry:
+    """
+    Keep one game session for each (guild, channel) pair.
+
+    Sessions are kept in least-recently-used order. Sessions that haven't been used for
+    ``idle_ttl`` seconds are evicted, as are the oldest sessions once there are more than
+    ``max_sessions``. A session is never evicted while it is in use.
+
+    Games that were restored from the store, or evicted while still in progress, are kept in
+    ``restored`` as compact states until their channel is active again.
+    """
+
+    def __init__(self, idle_ttl: float, max_sessions: int):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[SessionKey, Session] = OrderedDict()
+        self.restored: dict[SessionKey, dict[str, Any]] = {}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def get(self, guild_id: int, channel_id: int, resolve: Callable[[int], Member | None]) -> Session:
+        key = (guild_id, channel_id)
+        session = self.sessions.get(key)
+        if session is None:
+            state = self.restored.pop(key, None)
+            if state is None:
+                logger.debug(f"Starting a new session for {key=}")
+                session = Session(key=key)
+            else:
+                logger.debug(f"Restoring the session for {key=}")
+                session = Session(key=key, game=load_game(state, resolve))
+            self.sessions[key] = session
+        else:
+            self.sessions.move_to_end(key)
+        session.last_used = time.monotonic()
+        self.evict(keep=key)
+        return session
+
+    @contextmanager
+    def use(self, guild_id: int, channel_id: int, resolve: Callable[[int], Member | None]):
+        """
+        Get a session and keep it from being evicted until the block exits, however long it waits.
+        """
+        session = self.get(guild_id, channel_id, resolve)
+        session.users += 1
+        try:
+            yield session
+        finally:
+            session.users -= 1
+
+    def evict(self, keep: SessionKey | None = None):
+        cutoff = time.monotonic() - self.idle_ttl
+        remaining = len(self.sessions)
+        stale_keys = []
+        for session in self.sessions.values():
+            if remaining <= self.max_sessions and session.last_used > cutoff:
+                break
+            if session.key == keep or session.users > 0:
+                continue
+            stale_keys.append(session.key)
+            remaining -= 1
+
+        for key in stale_keys:
+            logger.debug(f"Evicting idle session for {key=}")
+            state = dump_game(self.sessions.pop(key).game)
+            if not is_empty(state):
+                self.restored[key] = state
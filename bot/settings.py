@@ -0,0 +1,96 @@
+from pathlib import Path
+
+from pydantic_settings import BaseSettings
+
+from bot.constants import LogLevelEnum
+
+
+class Settings(BaseSettings):
+    """
+    Provide a pydantic ``BaseSettings`` model for the application settings.
+    """
+
+    DEPLOY_ENV: str = "LOCAL"
+
+    LOG_LEVEL: LogLevelEnum = LogLevelEnum.DEBUG
+
+    METRICS_ENABLED: bool = True
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9108
+
+    DATA_DIR: Path = Path("data")
+
+    SHARD_COUNT: int | None = None
+    SHARD_IDS: list[int] | None = None
+    SHARD_PROCESSES: int = 1
+    SHARD_RESTART_DELAY: float = 1.0
+    SHARD_RESTART_MAX_DELAY: float = 60.0
+    SHARD_STOP_TIMEOUT: float = 10.0
+
+    RELOAD_DEBOUNCE: float = 0.5
+
+    DISCORD_TOKEN: str
+    OPENAI_API_KEY: str
+    OPENAI_API_BASE: str | None = None
+
+    GRAMMAR_CONFIDENCE_THRESHOLD: float = 0.75
+    NAME_MATCH_THRESHOLD: float = 0.6
+
+    INGEST_MAX_QUEUE: int = 1000
+    INGEST_WORKERS: int = 32
+    INGEST_COALESCE_WINDOW: float = 2.0
+
+    THROTTLE_USER_RATE: float = 0.2
+    THROTTLE_USER_BURST: float = 3
+    THROTTLE_CHANNEL_RATE: float = 1.0
+    THROTTLE_CHANNEL_BURST: float = 10
+    THROTTLE_MAX_BUCKETS: int = 10000
+
+    SESSION_IDLE_TTL: float = 6 * 60 * 60
+    SESSION_MAX_COUNT: int = 10000
+
+    PERSIST_FLUSH_INTERVAL: float = 0.5
+    PERSIST_SNAPSHOT_EVERY: int = 1000
+
+    AI_MODEL: str = "gpt-3.5-turbo-16k"
+    AI_TIMEOUT: float = 10.0
+    AI_DEADLINE: float = 20.0
+    AI_MAX_RETRIES: int = 2
+    AI_RETRY_BASE_DELAY: float = 0.25
+    AI_RETRY_MAX_DELAY: float = 2.0
+    AI_BREAKER_FAILURE_THRESHOLD: int = 5
+    AI_BREAKER_RESET_TIMEOUT: float = 30.0
+    AI_MAX_CONCURRENCY: int = 8
+    AI_MAX_CONNECTIONS: int = 16
+    AI_KEEPALIVE_TIMEOUT: float = 60.0
+
+    AI_HISTORY_TOKEN_BUDGET: int = 3000
+    AI_HISTORY_MAX_TURNS: int = 20
+    AI_HISTORY_MAX_CHANNELS: int = 1000
+    AI_SUMMARIZE_HISTORY: bool = False
+    AI_SUMMARY_MAX_TOKENS: int = 150
+
+    AI_ROSTER_LIMIT: int = 200
+
+    CHAT_STREAMING: bool = True
+    CHAT_STREAM_EDIT_INTERVAL: float = 1.0
+
+    AI_CACHE_MAX_ENTRIES: int = 5000
+    AI_CACHE_TTL: float = 7 * 24 * 60 * 60
+
+    CLASSIFIER_ENABLED: bool = True
+    CLASSIFIER_THRESHOLD: float = 0.85
+    CLASSIFIER_MIN_EXAMPLES: int = 50
+    CLASSIFIER_RETRAIN_EVERY: int = 50
+    CLASSIFIER_MAX_EXAMPLES: int = 20000
+
+    POOL_REFILL_INTERVAL: float = 5.0
+    ORDEAL_POOL_ENABLED: bool = True
+    ORDEAL_POOL_SIZE: int = 30
+    ORDEAL_POOL_BATCH: int = 10
+    REPLY_POOL_ENABLED: bool = True
+    REPLY_POOL_SIZE: int = 40
+    REPLY_POOL_BATCH: int = 20
+
+    class Config:
+        env_file = ".env"
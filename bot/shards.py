@@ -0,0 +1,127 @@
+"""
+Run the bot as several worker processes that each own a subset of the gateway shards.
+
+Every worker is a normal ``bot`` process started with ``SHARD_IDS`` and ``SHARD_COUNT`` set.
+Games are kept in the shared SQLite store under ``DATA_DIR``, so a worker that crashes is
+restarted and picks its games back up::
+
+    SHARD_COUNT=8 SHARD_PROCESSES=4 poetry run shards
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+from loguru import logger
+
+from bot.config import settings
+
+
+def owns_guild(guild_id: int, shard_ids: list[int], shard_count: int) -> bool:
+    return (guild_id >> 22) % shard_count in shard_ids
+
+
+def assign_shards(shard_count: int, processes: int) -> list[list[int]]:
+    return [list(range(i, shard_count, processes)) for i in range(min(processes, shard_count))]
+
+
+@dataclass
+class Worker:
+    index: int
+    shard_ids: list[int]
+    process: subprocess.Popen | None = None
+    started_at: float = 0.0
+    restart_delay: float = 0.0
+    restart_at: float | None = None
+
+    @property
+    def env(self) -> dict[str, str]:
+        return os.environ | dict(
+            SHARD_IDS=f"[{','.join(str(i) for i in self.shard_ids)}]",
+            SHARD_COUNT=str(settings.SHARD_COUNT),
+            METRICS_PORT=str(settings.METRICS_PORT + self.index),
+        )
+
+    def start(self):
+        logger.info(f"Starting worker {self.index} for shards {self.shard_ids}")
+        self.process = subprocess.Popen([sys.executable, "-m", "bot.main"], env=self.env)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+
+    def check(self, now: float):
+        """
+        Restart the worker if it died, backing off while it keeps crashing soon after starting.
+        """
+        if self.restart_at is not None:
+            if now >= self.restart_at:
+                self.start()
+            return
+
+        code = self.process.poll()
+        if code is None:
+            return
+
+        if now - self.started_at >= settings.SHARD_RESTART_MAX_DELAY:
+            self.restart_delay = 0.0
+        self.restart_delay = min(
+            settings.SHARD_RESTART_MAX_DELAY,
+            max(settings.SHARD_RESTART_DELAY, self.restart_delay * 2),
+        )
+        logger.warning(f"Worker {self.index} exited with {code=}. Restarting in {self.restart_delay:.0f}s")
+        self.restart_at = now + self.restart_delay
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+
+    def wait(self, timeout: float):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Worker {self.index} didn't stop in time. Killing it")
+            self.process.kill()
+
+
+def run():
+    shard_count = settings.SHARD_COUNT
+    if shard_count is None:
+        shard_count = settings.SHARD_PROCESSES
+        settings.SHARD_COUNT = shard_count
+
+    workers = [
+        Worker(index=i, shard_ids=shard_ids)
+        for (i, shard_ids) in enumerate(assign_shards(shard_count, settings.SHARD_PROCESSES))
+    ]
+    logger.info(f"Running {shard_count} shards in {len(workers)} worker processes")
+
+    stopping = False
+
+    def _stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    for worker in workers:
+        worker.start()
+    while not stopping:
+        time.sleep(0.5)
+        now = time.monotonic()
+        for worker in workers:
+            worker.check(now)
+
+    logger.info("Stopping workers")
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.wait(timeout=settings.SHARD_STOP_TIMEOUT)
+
+
+if __name__ == "__main__":
+    run()
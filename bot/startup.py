@@ -0,0 +1,33 @@
+import time
+
+from bot.metrics import observe
+
+
+# Set when this module is first imported, which bot.main does before anything heavy
+started_at = time.perf_counter()
+marks: list[tuple[str, float]] = []
+
+
+def mark(stage: str) -> bool:
+    """
+    Record that a startup stage just finished, timing it from the end of the previous one.
+
+    Stages that were already marked, e.g. ``ready`` after a reconnect, are ignored.
+    """
+    if any(name == stage for (name, _) in marks):
+        return False
+    now = time.perf_counter()
+    previous = marks[-1][1] if len(marks) > 0 else started_at
+    marks.append((stage, now))
+    observe(f"startup_{stage}", now - previous)
+    return True
+
+
+def report() -> str:
+    parts = []
+    previous = started_at
+    for (stage, at) in marks:
+        parts.append(f"{stage}={(at - previous) * 1000:.0f}ms")
+        previous = at
+    total = (previous - started_at) * 1000
+    return f"Started in {total:.0f}ms ({', '.join(parts)})"
@@ -1,10 +1,10 @@
 from random import choice
 from typing import Protocol, Any
 
-from discord import Member
 from loguru import logger
 
 from bot.constants import GameStatus, Command, Poison, PLAYERS_REQUIRED_TO_PLAY
+from bot.metrics import transitions as transition_counter
 from bot.types import Game, Action
 
 
@@ -19,10 +19,12 @@ from bot.exceptions import (
     AlreadyJoinedError,
     NotJoinedError,
     AlreadyHaveProberError,
+    NoTargetError,
 )
 
 
-def report_status(game: Game, verbose=False):
+def report_status(action: Action, verbose=False):
+    game = action.game
     report = []
 
     friendly_statuses = {
@@ -44,14 +46,14 @@ def report_status(game: Game, verbose=False):
         if len(game.players) == 0:
             report.append("There are no players in the game yet.")
         else:
-            players = ", ".join([p.display_name for p in game.players])
+            players = ", ".join([action.display_name(p) for p in game.players])
             report.append(f"The current players are: {players}")
 
         if game.prober is not None:
-            report.append(f"The prober is {game.prober.display_name}")
+            report.append(f"The prober is {action.display_name(game.prober)}")
 
         if game.victim is not None:
-            report.append(f"The victim is {game.victim.display_name}")
+            report.append(f"The victim is {action.display_name(game.victim)}")
 
         if game.poison is not None:
             report.append(f"The posion is {game.poison}")
@@ -65,8 +67,8 @@ def report_status(game: Game, verbose=False):
 
 def process_action(action: Action):
     if action.command == Command.STATUS:
-        logger.info(f"<@{action.player.id}> wants to know the status of the game")
-        report_status(action.game, verbose=True)
+        logger.info(f"<@{action.player_id}> wants to know the status of the game")
+        report_status(action, verbose=True)
         return
 
     transition_function = NoSuchMappingError.enforce_defined(
@@ -74,40 +76,43 @@ def process_action(action: Action):
         f"There is no transition from status {action.game.status} for command {action.command}",
     )
     logger.debug(f"Processing {transition_function=}")
+    from_status = action.game.status
     action.game.status = transition_function(action)
-    report_status(action.game)
+    transition_counter.inc(command=action.command.value, from_status=from_status.value, to_status=action.game.status.value)
+    report_status(action)
 
 
 def join_game(action: Action) -> GameStatus:
-    AlreadyJoinedError.require_condition(action.player not in action.game.players, f"Player {action.player} has already joined the game")
-    action.game.players.append(action.player)
-    logger.info(f"<@{action.player.id}> has joined the game")
+    AlreadyJoinedError.require_condition(not action.game.has_player(action.player_id), f"Player {action.player_id} has already joined the game")
+    action.game.add_player(action.player_id)
+    logger.info(f"<@{action.player_id}> has joined the game")
     return action.game.status
 
 
 def enlist_player(action: Action) -> GameStatus:
-    AlreadyJoinedError.require_condition(action.target not in action.game.players, f"Player {action.player} has already joined the game")
-    action.game.players.append(action.target)
-    logger.info(f"<@{action.target.id}> has been enlisted into the game")
+    NoTargetError.require_condition(action.target_id is not None, "Can't enlist a player without knowing who they are")
+    AlreadyJoinedError.require_condition(not action.game.has_player(action.target_id), f"Player {action.target_id} has already joined the game")
+    action.game.add_player(action.target_id)
+    logger.info(f"<@{action.target_id}> has been enlisted into the game")
     return action.game.status
 
 
 def leave_game(action: Action) -> GameStatus:
-    NotJoinedError.require_condition(action.player in action.game.players, f"Player {action.player} has not joined the game")
-    action.game.players.remove(action.player)
-    logger.info(f"<@{action.player.id}> has left the game")
+    NotJoinedError.require_condition(action.game.has_player(action.player_id), f"Player {action.player_id} has not joined the game")
+    action.game.remove_player(action.player_id)
+    logger.info(f"<@{action.player_id}> has left the game")
     return action.game.status
 
 
 def list_players(action: Action) -> GameStatus:
-    logger.info(f"<@{action.player.id}> asked who is playing.")
-    player_list_text = " | ".join(f"<@{p.id}>" for p in action.game.players)
+    logger.info(f"<@{action.player_id}> asked who is playing.")
+    player_list_text = " | ".join(f"<@{p}>" for p in action.game.players)
     logger.info(f"Current players are: {player_list_text}.")
     return action.game.status
 
 
 def check_players(action: Action) -> GameStatus:
-    logger.info(f"<@{action.player.id}> checked game status")
+    logger.info(f"<@{action.player_id}> checked game status")
     if len(action.game.players) < PLAYERS_REQUIRED_TO_PLAY:
         logger.info(f"Not enough players ({len(action.game.players)}/{PLAYERS_REQUIRED_TO_PLAY}) to continue. Ending game.")
         action.game.victim = None
@@ -115,22 +120,22 @@ def check_players(action: Action) -> GameStatus:
         action.game.poison = None
         return GameStatus.IDLE
 
-    return Game.status
+    return action.game.status
 
 
 def check_prober(action: Action) -> GameStatus:
-    logger.info(f"<@{action.player.id}> checked prober status")
-    if action.game.prober not in action.game.players:
-        logger.info(f"The current prober <@{action.game.prober.id}> bailed.")
+    logger.info(f"<@{action.player_id}> checked prober status")
+    if not action.game.has_player(action.game.prober):
+        logger.info(f"The current prober <@{action.game.prober}> bailed.")
         action.game.prober = None
         return GameStatus.AWAITING_PROBER
-    return game.status
+    return action.game.status
 
 
 def check_victim(action: Action) -> GameStatus:
-    logger.info(f"<@{action.player.id}> checked victim status")
-    if action.game.prober not in action.game.players:
-        logger.info(f"The current victim <@{action.game.victim.id}> bailed.")
+    logger.info(f"<@{action.player_id}> checked victim status")
+    if not action.game.has_player(action.game.victim):
+        logger.info(f"The current victim <@{action.game.victim}> bailed.")
         action.game.victim = None
         action.game.poison = None
         return GameStatus.AWAITING_VICTIM
@@ -143,12 +148,12 @@ def pick_prober(action: Action) -> GameStatus:
         f"There is already a prober selected",
     )
 
-    if action.target is None:
-        action.game.prober = choice(action.game.players)
-        logger.info(f"Choosing a new prober at random...and it's <@{action.game.prober.id}>!")
+    if action.target_id is None:
+        action.game.prober = choice(list(action.game.players))
+        logger.info(f"Choosing a new prober at random...and it's <@{action.game.prober}>!")
     else:
-        action.game.prober = action.target
-        logger.info(f"<@{action.player.id}> chose <@{action.player.id}> as the new prober!")
+        action.game.prober = action.target_id
+        logger.info(f"<@{action.player_id}> chose <@{action.target_id}> as the new prober!")
     return GameStatus.AWAITING_VICTIM
 
 
@@ -157,12 +162,12 @@ def try_to_start_game(action: Action) -> GameStatus:
         len(action.game.players) >= PLAYERS_REQUIRED_TO_PLAY,
         f"Not enough players to play. Have {len(action.game.players)}; need {PLAYERS_REQUIRED_TO_PLAY}",
     )
-    logger.info(f"<@{action.player.id}> started the game")
+    logger.info(f"<@{action.player_id}> started the game")
     return GameStatus.AWAITING_PROBER
 
 
 def finish_game(action: Action) -> GameStatus:
-    logger.info(f"<@{action.player.id}> stopped the game")
+    logger.info(f"<@{action.player_id}> stopped the game")
     action.game.victim = None
     action.game.prober = None
     action.game.poison = None
@@ -170,38 +175,38 @@ def finish_game(action: Action) -> GameStatus:
 
 
 def choose_victim(action: Action) -> GameStatus:
-    NotJoinedError.require_condition(action.target in action.game.players, "Can't choose a victim {action.target} that isn't in the game")
-    action.game.victim = action.target
-    logger.info(f"<@{action.player.id}> challenged <@{action.target.id}>!")
+    NotJoinedError.require_condition(action.game.has_player(action.target_id), f"Can't choose a victim {action.target_id} that isn't in the game")
+    action.game.victim = action.target_id
+    logger.info(f"<@{action.player_id}> challenged <@{action.target_id}>!")
     return GameStatus.AWAITING_POISON
 
 
 def choose_poison(action: Action) -> GameStatus:
     action.game.poison = action.choice
-    logger.info(f"<@{action.player.id}> chose {action.choice}!")
+    logger.info(f"<@{action.player_id}> chose {action.choice}!")
     return GameStatus.AWAITING_ORDEAL
 
 
 def choose_ordeal(action: Action) -> GameStatus:
     action.game.ordeal = action.choice
-    logger.info(f"<@{action.player.id}> challenged <@{action.target.id}> with '{action.choice}'!")
+    logger.info(f"<@{action.player_id}> challenged <@{action.game.victim}> with '{action.choice}'!")
     return GameStatus.AWAITING_ACCEPT_ORDEAL
 
 
 def accept_ordeal(action: Action) -> GameStatus:
-    logger.info(f"<@{action.player.id}> accepted <@{action.game.prober.id}>'s challenge!")
+    logger.info(f"<@{action.player_id}> accepted <@{action.game.prober}>'s challenge!")
     return GameStatus.AWAITING_PROOFS
 
 
 def provide_proofs(action: Action) -> GameStatus:
-    logger.info(f"<@{action.player.id}> provided proof!")
+    logger.info(f"<@{action.player_id}> provided proof!")
     return GameStatus.AWAITING_ACCEPT_PROOFS
 
 
 def accept_proofs(action: Action) -> GameStatus:
-    logger.info(f"<@{action.player.id}> accepted <@{action.game.victim.id}>'s proof!")
+    logger.info(f"<@{action.player_id}> accepted <@{action.game.victim}>'s proof!")
     action.game.prober = action.game.victim
-    logger.info(f"Now it's <@{action.game.prober.id}>'s turn to pick a victim!")
+    logger.info(f"Now it's <@{action.game.prober}>'s turn to pick a victim!")
     action.game.victim = None
     action.game.poison = None
     action.game.ordeal = None
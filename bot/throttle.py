@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+
+class TokenBucket:
+    """
+    Allow bursts of up to ``capacity`` calls, refilled at ``rate`` calls per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, now: float) -> bool:
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class BucketMap:
+    """
+    Keep one token bucket per key, forgetting the least recently used keys beyond ``max_buckets``.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_buckets: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_buckets = max_buckets
+        self.buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+
+    def get(self, key: int) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+
+class Throttle:
+    """
+    Limit how often each user and each channel can make the bot call the AI.
+
+    A call is only allowed when both the user's bucket and the channel's bucket have a token,
+    and only then are tokens taken from them. A throttled user should be told once; ``warn``
+    says whether that has already happened since their last allowed call.
+    """
+
+    def __init__(
+        self,
+        user_rate: float,
+        user_burst: float,
+        channel_rate: float,
+        channel_burst: float,
+        max_buckets: int,
+    ):
+        self.users = BucketMap(user_rate, user_burst, max_buckets)
+        self.channels = BucketMap(channel_rate, channel_burst, max_buckets)
+        self.warned: set[int] = set()
+
+    def allow(self, user_id: int, channel_id: int) -> bool:
+        now = time.monotonic()
+        user_bucket = self.users.get(user_id)
+        channel_bucket = self.channels.get(channel_id)
+        user_bucket.refill(now)
+        channel_bucket.refill(now)
+        if user_bucket.tokens < 1 or channel_bucket.tokens < 1:
+            logger.debug(f"Throttling AI use for {user_id=} in {channel_id=}")
+            return False
+        user_bucket.take(now)
+        channel_bucket.take(now)
+        self.warned.discard(user_id)
+        return True
+
+    def warn(self, user_id: int) -> bool:
+        if user_id in self.warned:
+            return False
+        if len(self.warned) >= self.users.max_buckets:
+            self.warned.clear()
+        self.warned.add(user_id)
+        return True
@@ -1,38 +1,72 @@
+from __future__ import annotations
+
 from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable
 
-from discord import Member
+if TYPE_CHECKING:
+    from discord import Member
 
 from bot.constants import GameStatus, Command, Poison
 
 
-@dataclass
+SessionKey = tuple[int, int]
+
+
+@dataclass(slots=True)
 class Game:
-    players: list[Member] = field(default_factory=lambda: [])
-    prober: Member | None = None
-    victim: Member | None = None
+    """
+    The state of one game, with players referred to by their member ids.
+
+    ``players`` is used as an insertion-ordered set: the values are always None.
+    """
+    players: dict[int, None] = field(default_factory=dict)
+    prober: int | None = None
+    victim: int | None = None
     poison: Poison | None = None
     ordeal: str | None = None
     status: GameStatus = GameStatus.IDLE
 
+    def has_player(self, member_id: int | None) -> bool:
+        return member_id in self.players
+
+    def add_player(self, member_id: int):
+        self.players[member_id] = None
+
+    def remove_player(self, member_id: int):
+        del self.players[member_id]
+
     def reset(self):
         self.prober = None
         self.victim = None
         self.poison = None
         self.ordeal = None
-        self.status = GameStatus.Idle
+        self.status = GameStatus.IDLE
 
 
 @dataclass
-class CommandGuess:
+class IntentGuess:
     command: str
     explanation: str
-    target: str | None = None
+    target_id: int | None = None
+    target_name: str | None = None
+    choice: str | None = None
+    reply: str | None = None
 
 
 @dataclass
-class UserGuess:
+class NameMatch:
+    member_id: int
     name: str
-    explanation: str
+    score: float
+
+
+@dataclass
+class IntentMatch:
+    command: Command | None = None
+    target_id: int | None = None
+    target_name: str | None = None
+    choice: Poison | str | None = None
+    confidence: float = 0.0
 
 
 @dataclass
@@ -46,13 +80,21 @@ class ActionGuess:
 @dataclass
 class Action:
     command: Command
-    player: Member
+    player_id: int
     game: Game
-    target: Member | None
+    target_id: int | None
     choice: Poison | str
+    resolve: Callable[[int], Member | None] = field(default=lambda _: None, repr=False)
+
+    def display_name(self, member_id: int) -> str:
+        """
+        Look up how a member should be named in a reply, falling back to a mention.
+        """
+        member = self.resolve(member_id)
+        return f"<@{member_id}>" if member is None else member.display_name
 
     def __str__(self):
         target_info = ""
-        if self.target is not None:
-            target_info = f": target={self.target}"
-        return f"player={self.player} issued command={self.command}{target_info}"
+        if self.target_id is not None:
+            target_info = f": target={self.target_id}"
+        return f"player={self.player_id} issued command={self.command}{target_info}"
@@ -1,6 +1,9 @@
+import argparse
+import asyncio
 import time
 import shlex
 import subprocess
+import sys
 from loguru import logger
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
@@ -36,9 +39,10 @@ class RestartHandler(FileSystemEventHandler):
         self.trigger(event)
 
 
-def run():
+def restart_on_change():
 
-    handler = RestartHandler("poetry run bot")
+    # Skip the startup cost of poetry on every restart by running the module directly
+    handler = RestartHandler(f"{shlex.quote(sys.executable)} -m bot.main")
     observer = Observer()
     observer.schedule(handler, "bot", recursive=True)
     observer.start()
@@ -48,3 +52,47 @@ def run():
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+
+
+async def reload_on_change():
+    from bot import startup
+    from bot.config import settings
+    from bot.main import build_client
+    from bot.reloader import Reloader
+
+    startup.mark("imports")
+    token = settings.DISCORD_TOKEN
+    startup.mark("settings")
+    client = build_client()
+    startup.mark("client")
+    reloader = Reloader(client, debounce=settings.RELOAD_DEBOUNCE)
+    async with client:
+        reloader.start()
+        try:
+            await client.start(token)
+        finally:
+            reloader.stop()
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Run the bot and pick up changes to its source")
+    parser.add_argument(
+        "--mode",
+        choices=["reload", "restart"],
+        default="reload",
+        help="Reload changed modules in the running bot, or restart the whole process on every change",
+    )
+    args = parser.parse_args()
+
+    if args.mode == "restart":
+        restart_on_change()
+        return
+
+    try:
+        asyncio.run(reload_on_change())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run()